@@ -28,7 +28,7 @@ setup(
     author_email="cfhamlet@gmail.com",
     url="https://github.com/cfhamlet/os-pywf",
     install_requires=open("requirements/requirements.txt").read().split("\n"),
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     zip_safe=False,
     entry_points={"console_scripts": ["os-pywf = os_pywf.main:main"]},
     classifiers=[
@@ -37,7 +37,6 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Natural Language :: English",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3 :: Only",
@@ -0,0 +1,69 @@
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+# file descriptors kept for stdio, log files, dns and the interpreter itself
+RESERVED_FDS = 64
+
+MAX_POLLER_THREADS = 16
+MAX_HANDLER_THREADS = 8
+MIN_DNS_THREADS = 4
+MAX_DNS_THREADS = 32
+HOSTS_PER_DNS_THREAD = 8
+
+
+def clamp(value, low, high):
+    return max(low, min(value, high))
+
+
+def nofile_limit():
+    try:
+        import resource
+    except ImportError:  # not unix
+        return None
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return None
+    return soft
+
+
+def autotune(hosts=0, concurrency=0, cpu_count=None, nofile=None):
+    """Pick Workflow global settings from the machine and the job shape.
+
+    hosts is the number of distinct hosts, concurrency the number of requests
+    that may be in flight at the same time, 0 means unknown. Return a dict with
+    the same keys as the command line options, only the tuned ones.
+    """
+    if cpu_count is None:
+        cpu_count = os.cpu_count() or 1
+    if nofile is None:
+        nofile = nofile_limit()
+
+    settings = {
+        "compute_threads": cpu_count,
+        # handler threads run Python callbacks, more threads than this only
+        # contend for the GIL
+        "handler_threads": clamp(cpu_count, 2, MAX_HANDLER_THREADS),
+        "poller_threads": clamp(cpu_count // 2, 1, MAX_POLLER_THREADS),
+    }
+
+    if hosts > 0:
+        settings["dns_threads"] = clamp(
+            math.ceil(hosts / HOSTS_PER_DNS_THREAD), MIN_DNS_THREADS, MAX_DNS_THREADS
+        )
+
+    # max_connections is a per endpoint limit
+    if concurrency > 0:
+        per_host = math.ceil(concurrency / max(hosts, 1))
+        if nofile is not None:
+            per_host = min(per_host, (nofile - RESERVED_FDS) // max(hosts, 1))
+        settings["max_connections"] = max(per_host, 1)
+
+    return settings
+
+
+def log_settings(settings, tuned):
+    chosen = " ".join([f"{k}={settings[k]}" for k in sorted(tuned)])
+    logger.info(f"autotune cpu_count={os.cpu_count()} nofile={nofile_limit()} {chosen}")
@@ -1,110 +1,260 @@
+from importlib import import_module
+from pkgutil import iter_modules
+
 import click
+from click.core import ParameterSource
 from click_option_group import optgroup
 
-from os_pywf.utils import walk_modules
-
 from . import __version__
 
+ENVVAR_PREFIX = "OS_PYWF"
+
+GLOBAL_SETTINGS = (
+    "compute_threads",
+    "handler_threads",
+    "poller_threads",
+    "dns_threads",
+    "dns_ttl_min",
+    "dns_ttl_default",
+)
+
+# defaults of the Workflow options, same as pywf GlobalSettings, kept here
+# so pywf is imported only when Workflow is initialized
+WORKFLOW_DEFAULTS = {
+    "compute_threads": 4,
+    "handler_threads": 4,
+    "poller_threads": 4,
+    "dns_threads": 4,
+    "dns_ttl_default": 43200,
+    "dns_ttl_min": 180,
+    "max_connections": 200,
+    "connection_timeout": 10000,
+    "response_timeout": 10000,
+    "ssl_connect_timeout": 10000,
+}
+
+# option name: attribute name of endpoint params
+ENDPOINT_PARAMS = {
+    "connection_timeout": "connect_timeout",
+    "max_connections": "max_connections",
+    "response_timeout": "response_timeout",
+    "ssl_connect_timeout": "ssl_connect_timeout",
+}
+
 
 class CommandFinder(click.MultiCommand):
+    """Discover subcommands by module name, import only the selected one.
+
+    Command modules are listed without being imported, the module behind a
+    command is imported the first time the command is requested and cached.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CommandFinder, self).__init__(*args, **kwargs)
+        self._manifest = None
+        self._commands = {}
+
     def list_commands(self, ctx):
         ctx.ensure_object(dict)
-        return list(self.__find_commnds(**ctx.obj).keys())
+        return sorted(self.__manifest(**ctx.obj).keys())
 
     def get_command(self, ctx, name):
         ctx.ensure_object(dict)
-        commands = self.__find_commnds(**ctx.obj)
-        return commands.get(name, None)
+        if name in self._commands:
+            return self._commands[name]
+        module_path = self.__manifest(**ctx.obj).get(name, None)
+        command = None
+        if module_path is not None:
+            cmd_module = import_module(module_path)
+            cli = getattr(cmd_module, "cli", None)
+            if isinstance(cli, click.Command):
+                command = cli
+        self._commands[name] = command
+        return command
 
-    def __find_commnds(self, **kwargs):
+    def __manifest(self, **kwargs):
+        if self._manifest is not None:
+            return self._manifest
         command_packages = kwargs.get("command_packages", [])
-        commands = {}
+        manifest = {}
         for command_package in command_packages:
-            for cmd_module in walk_modules(command_package, skip_fail=False):
-                if hasattr(cmd_module, "cli") and isinstance(
-                    cmd_module.cli, click.Command
-                ):
-                    name = cmd_module.__name__.split(".")[-1]
-                    name = name.replace("_", "-")
-                    commands[name] = cmd_module.cli
+            pkg = import_module(command_package)
+            for _, subpath, ispkg in iter_modules(getattr(pkg, "__path__", [])):
+                if ispkg or subpath.startswith("_"):
+                    continue
+                name = subpath.replace("_", "-")
+                manifest[name] = ".".join((command_package, subpath))
+        self._manifest = manifest
+        return manifest
 
-        return commands
 
+def load_config(ctx, param, value):
+    """Load a Python config file as default values of the options.
 
-def execute(**kwargs):
+    Upper case names are option names of os-pywf, dict values with a command
+    name are option names of the subcommand, e.g. MAX_CONNECTIONS = 500 or
+    CURL = {"RETRY": 3}.
+    """
+    if not value:
+        return value
+    from os_pywf.utils import is_public_upper, load_module_from_pyfile, vars_from_module
+
+    module = load_module_from_pyfile(value)
+    default_map = dict(ctx.default_map or {})
+    for k, v in vars_from_module(module, is_public_upper).items():
+        if isinstance(v, dict):
+            v = dict([(kk.lower(), vv) for kk, vv in v.items()])
+        default_map[k.lower()] = v
+    ctx.default_map = default_map
+    return value
+
+
+def init_workflow(ctx, hosts=0, concurrency=0):
+    """Init Workflow with the global settings of the command line.
+
+    Subcommands invoke it before creating tasks, only the first invocation
+    takes effect. With --autotune the settings which are not specified
+    explicitly are tuned with the number of distinct hosts and the number of
+    concurrent requests of the job.
+    """
+    ctx.ensure_object(dict)
+    workflow = ctx.obj.get("workflow", None)
+    if workflow is None or workflow["initialized"]:
+        return
     import pywf as wf
 
+    settings = workflow["settings"]
+    if workflow["autotune"]:
+        from os_pywf.autotune import autotune, log_settings
+
+        tuned = dict(
+            [
+                (k, v)
+                for k, v in autotune(hosts=hosts, concurrency=concurrency).items()
+                if k not in workflow["explicit"]
+            ]
+        )
+        settings.update(tuned)
+        log_settings(settings, tuned)
+
     gs = wf.GlobalSettings()
+    for k in GLOBAL_SETTINGS:
+        setattr(gs, k, settings.get(k, getattr(gs, k)))
+    for k, attr in ENDPOINT_PARAMS.items():
+        setattr(
+            gs.endpoint_params,
+            attr,
+            settings.get(k, getattr(gs.endpoint_params, attr)),
+        )
+
+    wf.WORKFLOW_library_init(gs)
+    workflow["initialized"] = True
+
 
-    @click.command(cls=CommandFinder, context_settings=dict(obj=kwargs))
+def execute(**kwargs):
+    @click.command(
+        cls=CommandFinder,
+        context_settings=dict(obj=kwargs, auto_envvar_prefix=ENVVAR_PREFIX),
+    )
     @click.version_option(version=__version__)
+    @click.option(
+        "--config",
+        type=click.Path(exists=True, dir_okay=False),
+        is_eager=True,
+        expose_value=False,
+        callback=load_config,
+        help="Python config file, upper case option names as variables.",
+    )
+    @click.option(
+        "--profile-startup",
+        is_flag=True,
+        expose_value=False,
+        help="Report import times of the command startup.",
+    )
+    @click.option(
+        "--profile",
+        is_flag=True,
+        help="Report time of request, response, cookie and callback stages and top allocators at exit.",
+    )
+    @click.option(
+        "--profile-top",
+        default=20,
+        show_default=True,
+        type=click.IntRange(min=1),
+        help="Number of top allocators in the profile report.",
+    )
     @optgroup.group("Workflow", help="Workflow global settings.")
+    @optgroup.option(
+        "--autotune",
+        is_flag=True,
+        help="Tune threads and connections with CPUs, ulimit and the job.",
+    )
     @optgroup.option(
         "--compute-threads",
-        default=gs.compute_threads,
+        default=WORKFLOW_DEFAULTS["compute_threads"],
         show_default=True,
         type=click.INT,
         help="Number of compute threads.",
     )
     @optgroup.option(
         "--handler-threads",
-        default=gs.handler_threads,
+        default=WORKFLOW_DEFAULTS["handler_threads"],
         show_default=True,
         type=click.INT,
         help="Number of handler threads.",
     )
     @optgroup.option(
         "--poller-threads",
-        default=gs.poller_threads,
+        default=WORKFLOW_DEFAULTS["poller_threads"],
         show_default=True,
         type=click.INT,
         help="Number of poller threads.",
     )
     @optgroup.option(
         "--dns-threads",
-        default=gs.dns_threads,
+        default=WORKFLOW_DEFAULTS["dns_threads"],
         show_default=True,
         type=click.INT,
         help="Number of dns threads.",
     )
     @optgroup.option(
         "--dns-ttl-default",
-        default=gs.dns_ttl_default,
+        default=WORKFLOW_DEFAULTS["dns_ttl_default"],
         show_default=True,
         type=click.INT,
         help="Default seconds of dns ttl.",
     )
     @optgroup.option(
         "--dns-ttl-min",
-        default=gs.dns_ttl_min,
+        default=WORKFLOW_DEFAULTS["dns_ttl_min"],
         show_default=True,
         type=click.INT,
         help="Min seconds of dns ttl.",
     )
     @optgroup.option(
         "--max-connections",
-        default=gs.endpoint_params.max_connections,
+        default=WORKFLOW_DEFAULTS["max_connections"],
         show_default=True,
         type=click.INT,
         help="Max number of connections.",
     )
     @optgroup.option(
         "--connection-timeout",
-        default=gs.endpoint_params.connect_timeout,
+        default=WORKFLOW_DEFAULTS["connection_timeout"],
         show_default=True,
         type=click.INT,
         help="Connect timeout(ms).",
     )
     @optgroup.option(
         "--response-timeout",
-        default=gs.endpoint_params.response_timeout,
+        default=WORKFLOW_DEFAULTS["response_timeout"],
         show_default=True,
         type=click.INT,
         help="Response timeout(ms).",
     )
     @optgroup.option(
         "--ssl-connect-timeout",
-        default=gs.endpoint_params.ssl_connect_timeout,
+        default=WORKFLOW_DEFAULTS["ssl_connect_timeout"],
         show_default=True,
         type=click.INT,
         help="SSL connect timeout(ms).",
@@ -112,24 +262,26 @@ def execute(**kwargs):
     @click.pass_context
     def cli(ctx, **kgs):
         """Command line tool for os-pywf."""
-        for k in (
-            "compute_threads",
-            "handler_threads",
-            "poller_threads",
-            "dns_threads",
-            "dns_ttl_min",
-            "dns_ttl_default",
-        ):
-            setattr(gs, k, kgs.get(k, getattr(gs, k)))
-
-        for k in (
-            "connect_timeout",
-            "max_connections",
-            "response_timeout",
-            "ssl_connect_timeout",
-        ):
-            setattr(gs.endpoint_params, k, kgs.get(k, getattr(gs.endpoint_params, k)))
-
-        wf.WORKFLOW_library_init(gs)
+        autotune = kgs.pop("autotune", False)
+        profile = kgs.pop("profile", False)
+        profile_top = kgs.pop("profile_top")
+        if profile:
+            from os_pywf.profiling import Profiler, report_profile, set_profiler
+
+            profiler = Profiler(top=profile_top)
+            set_profiler(profiler)
+            profiler.start()
+            ctx.call_on_close(report_profile)
+        explicit = set(
+            [k for k in kgs if ctx.get_parameter_source(k) != ParameterSource.DEFAULT]
+        )
+        ctx.obj["workflow"] = {
+            "settings": kgs,
+            "explicit": explicit,
+            "autotune": autotune,
+            "initialized": False,
+        }
+        # subcommands init Workflow with init_workflow before creating any
+        # task, when the job is known and after forking worker processes
 
     cli()
@@ -1,22 +1,32 @@
+import json
 import logging
+import math
+import multiprocessing
 import os
+import shutil
 import signal
+import statistics
 import sys
+import tempfile
+import threading
 import time
-from typing import Type, Union
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Type, Union
+from urllib.parse import urlparse
 
 import click
-import pywf
-import requests
 from click_option_group import optgroup
-from requests.models import DEFAULT_REDIRECT_LIMIT
-from requests.structures import CaseInsensitiveDict
 
 import os_pywf
+from os_pywf import tracing
+from os_pywf.cmdline import init_workflow
 from os_pywf.exceptions import Failure
-from os_pywf.http.client import HTTP_10, HTTP_11, Session
+from os_pywf.profiling import report_profile
 from os_pywf.utils import (
     LogLevel,
+    MultipartBody,
+    Stats,
     bytes_from_data,
     cookiejar_from_file,
     cookiejar_from_string,
@@ -28,13 +38,21 @@ from os_pywf.utils import (
     save_cookiejar,
 )
 
+if TYPE_CHECKING:
+    import pywf
+    import requests
+
 logger = logging.getLogger(__name__)
 
-pywf_settings = pywf.get_global_settings()
+# same as requests.models.DEFAULT_REDIRECT_LIMIT, requests is imported only
+# when the command runs
+DEFAULT_REDIRECT_LIMIT = 30
 
 
 def callback(
-    task: pywf.HttpTask, request: requests.PreparedRequest, response: requests.Response
+    task: "pywf.HttpTask",
+    request: "requests.PreparedRequest",
+    response: "requests.Response",
 ):
     logf = logger.info
     if isinstance(response, Failure):
@@ -42,18 +60,120 @@ def callback(
     logf(f"{request.method} {request.url} {response}")
 
 
-def errback(task: pywf.HttpTask, request: requests.PreparedRequest, failure: Failure):
+def errback(
+    task: "pywf.HttpTask", request: "requests.PreparedRequest", failure: Failure
+):
     logger.error(f"{request.method} {request.url} {failure}")
 
 
-def startup(runner: Union[pywf.SeriesWork, Type[pywf.SubTask]]):
+def shard_urls(urls, shards):
+    o = [[] for _ in range(shards)]
+    for url in urls:
+        o[zlib.crc32(urlparse(url).netloc.encode("utf8")) % shards].append(url)
+    return o
+
+
+def estimate_concurrency(
+    requests, fanout=False, fanout_concurrency=0, hedge_ratio=0, max_inflight=None
+):
+    """Estimate the requests in flight at the same time, 0 means unknown.
+
+    Each request may fan out fanout_concurrency requests when callbacks return
+    a Batch, an unbounded fan out is unknown. Hedges add up to hedge_ratio
+    copies and max_inflight requests may wait to be started.
+    """
+    if fanout:
+        if not fanout_concurrency:
+            return 0
+        requests *= fanout_concurrency + 1
+    if hedge_ratio:
+        requests += math.ceil(requests * hedge_ratio)
+    if max_inflight:
+        requests = max(requests, max_inflight)
+    return requests
+
+
+def worker_path(path, worker):
+    dirname, basename = os.path.split(path)
+    t = basename.find(".", 1)
+    if t < 0:
+        basename = f"{basename}-{worker}"
+    else:
+        basename = f"{basename[:t]}-{worker}{basename[t:]}"
+    return os.path.join(dirname, basename)
+
+
+def wait_workers(pids, tmpdir, cookie_file=None, cookie_db=None):
+    def _forward(signum, frame):
+        logger.debug(f"receive signal {signal.Signals(signum).name}")
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _forward)
+
+    code = 0
+    running = dict(pids)
+    while running:
+        pid, status = os.waitpid(-1, 0)
+        if pid not in running:
+            continue
+        running.pop(pid)
+        if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+            code = 1
+
+    stats = Stats()
+    cookiejar = None
+    for worker in sorted(pids.values()):
+        stats_file = os.path.join(tmpdir, f"stats-{worker}.json")
+        if os.path.exists(stats_file):
+            with open(stats_file) as f:
+                worker_stats = json.load(f)
+            logger.debug(f"worker {worker} stats {worker_stats}")
+            stats.merge(worker_stats)
+        cookies_file = os.path.join(tmpdir, f"cookies-{worker}.txt")
+        if os.path.exists(cookies_file):
+            cj = cookiejar_from_file(cookies_file)
+            if cookiejar is None:
+                cookiejar = cj
+            else:
+                for cookie in cj:
+                    cookiejar.set_cookie(cookie)
+    logger.info(f"workers {len(pids)} stats {stats.to_dict()}")
+    if cookie_file and cookie_db:
+        from os_pywf.http.cookies import SqliteCookieJar
+
+        # workers shared the database, it has the cookies of all of them
+        cookiejar = SqliteCookieJar(cookie_db)
+        cookiejar.load_all()
+        save_cookiejar(cookie_file.name, cookiejar)
+        cookiejar.close()
+    elif cookie_file and cookiejar:
+        save_cookiejar(cookie_file.name, cookiejar)
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return code
+
+
+def recording(writer, callback):
+    def _callback(task, request, response):
+        writer.record(task, request, response)
+        if callback:
+            return callback(task, request, response)
+
+    return _callback
+
+
+def startup(runner: Union["pywf.SeriesWork", Type["pywf.SubTask"]]):
     ctx = runner.get_context()
     if ctx is None:
         runner.set_context({"start_time": time.time()})
     logger.debug("start")
 
 
-def cleanup(runner: Union[pywf.SeriesWork, Type[pywf.SubTask]]):
+def cleanup(runner: Union["pywf.SeriesWork", Type["pywf.SubTask"]]):
     ctx = runner.get_context()
     msg = "finish"
     if ctx and isinstance(ctx, dict) and "start_time" in ctx:
@@ -62,6 +182,19 @@ def cleanup(runner: Union[pywf.SeriesWork, Type[pywf.SubTask]]):
     logger.debug(msg)
 
 
+def log_warmup(times):
+    for base, elapsed in times.items():
+        ok = [e * 1000 for e in elapsed if e is not None]
+        if not ok:
+            logger.warning(f"warmup {base} failed {len(elapsed)} connections")
+            continue
+        logger.info(
+            f"warmup {base} {len(ok)}/{len(elapsed)} connections "
+            f"handshake ms min {min(ok):.1f} median {statistics.median(ok):.1f} "
+            f"max {max(ok):.1f}"
+        )
+
+
 def load_cookiejar(s: str):
     if os.path.exists(s) and os.path.isfile(s):
         return cookiejar_from_file(s)
@@ -97,6 +230,16 @@ def load_cookiejar(s: str):
     type=click.File(mode="w"),
     help="Write cookies to this file after operation.",
 )
+@optgroup.option(
+    "--cookie-db",
+    type=click.Path(dir_okay=False),
+    help="Persist cookies in this sqlite database, shared by workers.",
+)
+@optgroup.option(
+    "--resolve",
+    multiple=True,
+    help="Resolve the host:port to this address, HOST:PORT:ADDR[,ADDR...].",
+)
 @optgroup.option(
     "-d",
     "--data",
@@ -220,7 +363,210 @@ def load_cookiejar(s: str):
     show_default=True,
     help="Function invoked when request fail (callback will be invoked when no errback).",
 )
+@optgroup.option(
+    "--callback-executor",
+    default=None,
+    type=click.Choice(["compute", "thread", "process"], case_sensitive=False),
+    help="Run callback/errback on compute threads, a thread pool or a process pool instead of handler threads.",
+)
+@optgroup.option(
+    "--callback-workers",
+    type=click.INT,
+    default=None,
+    help="Number of workers of the callback thread/process pool. [default: CPU count]",
+)
+@optgroup.option(
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Write response bodies to files of this directory.",
+)
+@optgroup.option(
+    "--output-jsonl",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Append response metadata to this JSON lines file.",
+)
+@optgroup.option(
+    "--output-warc",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Append requests and responses to this WARC file (gzip if ends with .gz).",
+)
+@optgroup.option(
+    "--output-har",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write requests and responses to this HAR file.",
+)
+@optgroup.option(
+    "--replay",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    default=None,
+    help="Send requests of a HAR file or a JSON lines request spec (.jsonl).",
+)
+@optgroup.option(
+    "--replay-speed",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    show_default=True,
+    help="Replay timing, 1 is the original timing, 2 twice as fast, 0 as fast as possible.",
+)
+@optgroup.option(
+    "--replay-concurrency",
+    type=click.IntRange(min=1),
+    default=100,
+    show_default=True,
+    help="Max in-flight replayed requests.",
+)
 @optgroup.option("--parallel", is_flag=True, help="Send requests parallelly.")
+@optgroup.option(
+    "--rate",
+    type=click.FLOAT,
+    default=None,
+    help="Max requests per second of all hosts.",
+)
+@optgroup.option(
+    "--rate-per-host",
+    type=click.FLOAT,
+    default=None,
+    help="Max requests per second of each host.",
+)
+@optgroup.option(
+    "--upstream",
+    multiple=True,
+    help="Upstream group used as URL host, NAME=HOST:PORT[*WEIGHT][,HOST:PORT[*WEIGHT]...].",
+)
+@optgroup.option(
+    "--upstream-policy",
+    default="weighted",
+    show_default=True,
+    type=click.Choice(
+        ["weighted", "consistent-hash", "round-robin", "least-loaded"],
+        case_sensitive=False,
+    ),
+    help="Server selection policy of upstream groups.",
+)
+@optgroup.option(
+    "--upstream-max-fails",
+    type=click.IntRange(min=1),
+    default=3,
+    show_default=True,
+    help="Consecutive failures before a server is ejected for a while.",
+)
+@optgroup.option(
+    "--warmup",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Keep-alive connections to open to each host before sending requests, at most --max-connections.",
+)
+@optgroup.option(
+    "--dns-prewarm",
+    is_flag=True,
+    help="Resolve all hosts of the URLs concurrently before sending requests.",
+)
+@optgroup.option(
+    "--hedge-delay",
+    default=None,
+    help="Send a second copy of GET/HEAD/OPTIONS request when no response after seconds or a percentile of recent latencies, e.g. 0.05 or p95.",
+)
+@optgroup.option(
+    "--hedge-ratio",
+    type=click.FloatRange(min=0, max=1),
+    default=0.1,
+    show_default=True,
+    help="Max ratio of hedged requests.",
+)
+@optgroup.option(
+    "--circuit-failure-ratio",
+    type=click.FloatRange(min=0, max=1, min_open=True),
+    default=None,
+    help="Fail fast requests of a host when this ratio of its recent requests failed.",
+)
+@optgroup.option(
+    "--circuit-reset-timeout",
+    type=click.FloatRange(min=0),
+    default=10,
+    show_default=True,
+    help="Seconds before an open circuit lets probe requests through.",
+)
+@optgroup.option(
+    "--fanout-concurrency",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Max in-flight requests of a Batch returned by callback, 0 means all.",
+)
+@optgroup.option(
+    "--lean-history",
+    is_flag=True,
+    help="Keep only status, URL and headers of redirect responses in history.",
+)
+@optgroup.option(
+    "--raw-response",
+    is_flag=True,
+    help="Hand callback lightweight raw responses, cookies and hooks are not processed.",
+)
+@optgroup.option(
+    "--max-inflight",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Max in-flight requests, waiting requests are started by priority.",
+)
+@optgroup.option(
+    "--priority-aging",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    show_default=True,
+    help="Priority points a waiting request gains per second.",
+)
+@optgroup.option(
+    "--adaptive-concurrency",
+    is_flag=True,
+    help="Adjust in-flight limit of each host by latency, errors and 429/503.",
+)
+@optgroup.option(
+    "--adaptive-initial-limit",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Initial in-flight limit of a host with adaptive concurrency.",
+)
+@optgroup.option(
+    "--adaptive-max-limit",
+    type=click.IntRange(min=1),
+    default=256,
+    show_default=True,
+    help="Max in-flight limit of a host with adaptive concurrency.",
+)
+@optgroup.option(
+    "--trace",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write spans of requests, callbacks and timers to this file.",
+)
+@optgroup.option(
+    "--trace-format",
+    default="chrome",
+    show_default=True,
+    type=click.Choice(["chrome", "otlp"], case_sensitive=False),
+    help="Chrome trace events or OTLP JSON.",
+)
+@optgroup.option(
+    "--trace-sample",
+    type=click.FloatRange(min=0, max=1),
+    default=1.0,
+    show_default=True,
+    help="Ratio of traced requests.",
+)
+@optgroup.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes, URLs are sharded by host.",
+)
 @optgroup.option(
     "--log-level",
     default="INFO",
@@ -234,10 +580,23 @@ def load_cookiejar(s: str):
 def cli(ctx, **kwargs):
     "HTTP client inspired by curl (beta)."
 
-    if not kwargs.get("urls", ()):
+    if not kwargs.get("urls", ()) and not kwargs.get("replay", None):
         click.echo(cli.get_help(ctx))
         ctx.exit(0)
 
+    import pywf
+    from requests.structures import CaseInsensitiveDict
+
+    from os_pywf.http.adaptive import AdaptiveLimiter
+    from os_pywf.http.breaker import CircuitBreaker
+    from os_pywf.http.client import HTTP_10, HTTP_11, Session
+    from os_pywf.http.cookies import SqliteCookieJar
+    from os_pywf.http.hedge import delay_from_string
+    from os_pywf.http.output import BodySink, HarSink, JsonlSink, OutputWriter, WarcSink
+    from os_pywf.http.replay import Replayer, iter_specs
+    from os_pywf.http.resolve import resolve_from_string, upstreams_from_resolve
+    from os_pywf.http.upstream import upstream_from_string
+
     debug = kwargs.get("debug", False)
 
     loglevel = "DEBUG" if debug else kwargs.get("log_level", "INFO").upper()
@@ -249,6 +608,9 @@ def cli(ctx, **kwargs):
     for k in ("debug", "log_level"):
         kwargs.pop(k, None)
 
+    urls = kwargs.pop("urls", ())
+    parallel = kwargs.pop("parallel", False)
+
     sys.path.insert(0, ".")
     funcs = dict.fromkeys(("cleanup", "startup", "callback", "errback"))
     for name in funcs:
@@ -256,16 +618,6 @@ def cli(ctx, **kwargs):
             f = load_obj(kwargs.pop(name))
             funcs[name] = f
 
-    runner = None
-    append = None
-    parallel = kwargs.pop("parallel", False)
-    if parallel:
-        runner = pywf.create_parallel_work(None)
-        append = runner.add_series
-    else:
-        runner = create_series_work()
-        append = runner.push_back
-
     timeout = (kwargs.pop("send_timeout", -1), kwargs.pop("receive_timeout", -1))
 
     headers = CaseInsensitiveDict()
@@ -293,21 +645,25 @@ def cli(ctx, **kwargs):
     max_redirs = kwargs.pop("max_redirs")
     location = kwargs.pop("location")
     max_size = kwargs.pop("max_filesize")
-    urls = kwargs.pop("urls", ())
 
     method = kwargs.pop("request")
     data = kwargs.pop("data")
-    if data:
+    if len(data) == 1:
+        # single file is streamed
+        data = bytes_from_data(data[0], lazy=True)
+    elif data:
         data = b"&".join([bytes_from_data(d) for d in data])
+    else:
+        data = None
 
     data_ed = kwargs.pop("data_urlencode")
     if data_ed:
         o = b"&".join([bytes_from_data(d, True) for d in data_ed])
-        if isinstance(data, bytes):
-            data = b"&".join((data, o))
+        if data is not None:
+            data = b"&".join((bytes(data), o))
         else:
             data = o
-    if isinstance(data, bytes):
+    if data is not None:
         if method is None:
             method = "POST"
         if "content-type" not in headers:
@@ -315,9 +671,11 @@ def cli(ctx, **kwargs):
 
     forms = kwargs.pop("form")
     if forms:
-        if isinstance(data, bytes):
+        if data is not None:
             raise RuntimeError("You can only select one HTTP request!")
-        forms = [formparam_from_string(s) for s in forms]
+        data = MultipartBody([formparam_from_string(s) for s in forms])
+        if "content-type" not in headers:
+            headers["content-type"] = data.content_type
         if method is None:
             method = "POST"
 
@@ -331,6 +689,169 @@ def cli(ctx, **kwargs):
     if kwargs.get("proxy", None):
         proxies = {"http": kwargs.pop("proxy")}
 
+    upstream_policy = kwargs.pop("upstream_policy").lower()
+    upstream_max_fails = kwargs.pop("upstream_max_fails")
+    try:
+        upstreams = [
+            upstream_from_string(
+                s, policy=upstream_policy, max_fails=upstream_max_fails
+            )
+            for s in kwargs.pop("upstream")
+        ]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--upstream")
+
+    resolve = {}
+    try:
+        for v in kwargs.pop("resolve", ()):
+            host, port, addresses = resolve_from_string(v)
+            resolve.setdefault((host, port), []).extend(addresses)
+        upstreams_from_resolve(resolve)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--resolve")
+    dns_prewarm = kwargs.pop("dns_prewarm", False)
+    warmup = kwargs.pop("warmup", 0)
+
+    hedge_delay = kwargs.pop("hedge_delay", None)
+    hedge_ratio = kwargs.pop("hedge_ratio")
+    if hedge_delay is not None:
+        try:
+            delay_from_string(hedge_delay)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--hedge-delay")
+        if kwargs.get("output_warc", None):
+            raise click.UsageError("--output-warc can not be used with --hedge-delay")
+
+    circuit_breaker = None
+    circuit_failure_ratio = kwargs.pop("circuit_failure_ratio", None)
+    circuit_reset_timeout = kwargs.pop("circuit_reset_timeout")
+    if circuit_failure_ratio is not None:
+        circuit_breaker = CircuitBreaker(
+            failure_ratio=circuit_failure_ratio, reset_timeout=circuit_reset_timeout
+        )
+
+    adaptive_limiter = None
+    adaptive_initial_limit = kwargs.pop("adaptive_initial_limit")
+    adaptive_max_limit = kwargs.pop("adaptive_max_limit")
+    if kwargs.pop("adaptive_concurrency", False):
+        adaptive_limiter = AdaptiveLimiter(
+            initial_limit=adaptive_initial_limit, max_limit=adaptive_max_limit
+        )
+
+    outputs = ("output_dir", "output_jsonl", "output_warc", "output_har")
+    if kwargs.get("callback_executor", None) == "process" and any(
+        [kwargs.get(k) for k in outputs]
+    ):
+        raise click.UsageError(
+            "output options can not be used with process callback executor"
+        )
+    # raw WARC records are read from the task, offloaded callbacks get None
+    if kwargs.get("callback_executor", None) and kwargs.get("output_warc", None):
+        raise click.UsageError("--output-warc can not be used with --callback-executor")
+
+    replay = kwargs.pop("replay", None)
+    replay_speed = kwargs.pop("replay_speed")
+    replay_concurrency = kwargs.pop("replay_concurrency")
+
+    cookie_file = kwargs.pop("cookie_jar")
+    cookie_db = kwargs.pop("cookie_db", None)
+    workers = kwargs.pop("workers")
+    if replay and workers > 1:
+        raise click.UsageError("--replay can not be used with --workers")
+    worker = None
+    if workers > 1:
+        tmpdir = tempfile.mkdtemp(prefix="os-pywf-")
+        pids = {}
+        for i, shard in enumerate(shard_urls(urls, workers)):
+            if not shard:
+                continue
+            pid = os.fork()
+            if pid == 0:
+                worker, urls = i, shard
+                break
+            pids[pid] = i
+        if worker is None:
+            ctx.exit(wait_workers(pids, tmpdir, cookie_file, cookie_db))
+        for k in ("output_jsonl", "output_warc", "output_har", "trace"):
+            if kwargs.get(k, None):
+                kwargs[k] = worker_path(kwargs[k], worker)
+        if kwargs.get("output_dir", None):
+            kwargs["output_dir"] = os.path.join(kwargs["output_dir"], str(worker))
+
+    if replay:
+        init_workflow(ctx, concurrency=replay_concurrency)
+    else:
+        init_workflow(
+            ctx,
+            hosts=len(set([urlparse(url).netloc for url in urls])),
+            concurrency=estimate_concurrency(
+                len(urls) if parallel else 1,
+                fanout=funcs["callback"] is not callback
+                or funcs["errback"] is not None,
+                fanout_concurrency=kwargs.get("fanout_concurrency", 0),
+                hedge_ratio=hedge_ratio if hedge_delay is not None else 0,
+                max_inflight=kwargs.get("max_inflight", None),
+            ),
+        )
+
+    callback_executor = kwargs.pop("callback_executor", None)
+    callback_workers = kwargs.pop("callback_workers", None)
+    executor = None
+    if callback_executor == "thread":
+        executor = ThreadPoolExecutor(max_workers=callback_workers)
+        callback_executor = executor
+    elif callback_executor == "process":
+        executor = ProcessPoolExecutor(
+            max_workers=callback_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_logging,
+            initargs=(loglevel,),
+        )
+        callback_executor = executor
+
+    writer = None
+    sinks = []
+    if kwargs.get("output_dir", None):
+        sinks.append(BodySink(kwargs.pop("output_dir")))
+    if kwargs.get("output_jsonl", None):
+        sinks.append(JsonlSink(kwargs.pop("output_jsonl")))
+    if kwargs.get("output_warc", None):
+        sinks.append(WarcSink(kwargs.pop("output_warc")))
+    if kwargs.get("output_har", None):
+        sinks.append(HarSink(kwargs.pop("output_har")))
+    if sinks:
+        writer = OutputWriter(sinks)
+        writer.start()
+        funcs["callback"] = recording(writer, funcs["callback"])
+        # failures go to errback when there is one, record them too
+        if funcs["errback"]:
+            funcs["errback"] = recording(writer, funcs["errback"])
+
+    if cookie_db:
+        # opened after fork, each worker has its own connection
+        db = SqliteCookieJar(cookie_db)
+        if cookiejar is not None:
+            for cookie in cookiejar:
+                db.set_cookie(cookie)
+        cookiejar = db
+
+    tracer = None
+    trace_file = kwargs.pop("trace", None)
+    trace_format = kwargs.pop("trace_format").lower()
+    trace_sample = kwargs.pop("trace_sample")
+    if trace_file:
+        tracer = tracing.Tracer(sample_rate=trace_sample)
+        tracing.set_tracer(tracer)
+
+    runner = None
+    append = None
+    if parallel:
+        runner = pywf.create_parallel_work(None)
+        append = runner.add_series
+    else:
+        runner = create_series_work()
+        append = runner.push_back
+
     with Session(
         version=version,
         headers=headers,
@@ -346,19 +867,71 @@ def cli(ctx, **kwargs):
         max_size=max_size,
         callback=funcs["callback"],
         errback=funcs["errback"],
+        callback_executor=callback_executor,
+        rate=kwargs.pop("rate", None),
+        rate_per_host=kwargs.pop("rate_per_host", None),
+        upstreams=upstreams,
+        hedge_delay=hedge_delay,
+        hedge_ratio=hedge_ratio,
+        circuit_breaker=circuit_breaker,
+        fanout_concurrency=kwargs.pop("fanout_concurrency", 0),
+        lean_history=kwargs.pop("lean_history", False),
+        response_class="raw" if kwargs.pop("raw_response", False) else None,
+        max_inflight=kwargs.pop("max_inflight", None),
+        priority_aging=kwargs.pop("priority_aging", 1.0),
+        adaptive_limiter=adaptive_limiter,
+        resolve=resolve,
     ) as session:
 
+        if dns_prewarm:
+            hosts = set([urlparse(url).hostname for url in urls]) - set([None])
+            start = time.time()
+            resolved = session.prewarm_dns(hosts)
+            failed = session.stats.get("dns_prewarm_failed")
+            logger.info(
+                f"dns prewarm resolved {resolved} failed {failed} "
+                f"in {time.time() - start:.3f}s"
+            )
+
+        if warmup and urls:
+            # max_connections is per endpoint, autotuned or not, the warmed
+            # up connections of a host fit in it
+            gs = pywf.get_global_settings()
+            warmup = min(warmup, gs.endpoint_params.max_connections)
+            warmed = threading.Event()
+            warmup_task = session.warmup(urls, warmup, log_warmup)
+            pywf.create_series_work(warmup_task, lambda s: warmed.set()).start()
+            warmed.wait()
+
         for url in urls:
             o = session.request(
                 url,
                 data=data,
-                files=forms,
                 method=method if method is not None else "GET",
             )
             if parallel:
                 o = create_series_work(o)
             append(o)
 
+        replay_file = None
+        if replay:
+            replay_file = sys.stdin if replay == "-" else open(replay, encoding="utf8")
+
+            def _malformed(where, e):
+                logger.warning(f"skip malformed spec {replay} {where} {e!r}")
+                session.stats.inc("replay_errors")
+
+            replayer = Replayer(
+                session,
+                iter_specs(replay_file, replay, on_error=_malformed),
+                speed=replay_speed,
+                concurrency=replay_concurrency,
+            )
+            o = replayer.create_task()
+            if parallel:
+                o = create_series_work(o)
+            append(o)
+
         def _cancel(signum, frame):
             logger.debug(f"receive signal {signal.Signals(signum).name}")
             session.cancel()
@@ -371,15 +944,56 @@ def cli(ctx, **kwargs):
                 cancel.set()
             if funcs["cleanup"]:
                 funcs["cleanup"](runner)
+            if tracer is not None:
+                tracer.span("run", None, started, urls=len(urls))
 
         runner.set_callback(_cleanup)
 
         if funcs["startup"]:
             funcs["startup"](runner)
+        started = tracing.now_ns()
         runner.start()
         session.wait_cancel()
         pywf.wait_finish()
-
-        cookie_file = kwargs.pop("cookie_jar")
-        if cookie_file and session.cookies:
-            save_cookiejar(cookie_file.name, session.cookies)
+        if replay_file is not None and replay_file is not sys.stdin:
+            replay_file.close()
+        if executor is not None:
+            executor.shutdown()
+        if writer is not None:
+            writer.close()
+        if tracer is not None:
+            tracer.export(trace_file, trace_format)
+            if tracer.dropped:
+                logger.warning(f"trace spans dropped {tracer.dropped}")
+        if adaptive_limiter is not None:
+            limits = sorted(adaptive_limiter.limits().values())
+            if limits:
+                logger.info(
+                    f"adaptive limits hosts={len(limits)} min={limits[0]} "
+                    f"median={statistics.median(limits)} max={limits[-1]}"
+                )
+
+        if cookie_db:
+            if cookie_file and worker is None:
+                session.cookies.load_all()
+                save_cookiejar(cookie_file.name, session.cookies)
+            session.cookies.close()
+
+        if worker is not None:
+            with open(os.path.join(tmpdir, f"stats-{worker}.json"), "w") as f:
+                json.dump(session.stats.to_dict(), f)
+            if session.cookies and not cookie_db:
+                save_cookiejar(
+                    os.path.join(tmpdir, f"cookies-{worker}.txt"), session.cookies
+                )
+        else:
+            logger.debug(f"stats {session.stats.to_dict()}")
+            if cookie_file and session.cookies and not cookie_db:
+                save_cookiejar(cookie_file.name, session.cookies)
+
+    if worker is not None:
+        # the worker exits without cleanup of the context
+        report_profile()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
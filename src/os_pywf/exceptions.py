@@ -12,8 +12,28 @@ class Failure(BaseException):
 
 class WFException(Exception):
     def __init__(self, state, code):
+        super(WFException, self).__init__(state, code)
         self.state = state
         self.code = code
 
     def __str__(self):
         return wf_error_string(self.state, self.code)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, key):
+        super(CircuitOpenError, self).__init__(key)
+        self.key = key
+
+    def __str__(self):
+        return f"circuit of {self.key} is open"
+
+
+class ResolvedPortError(Exception):
+    def __init__(self, host, port):
+        super(ResolvedPortError, self).__init__(host, port)
+        self.host = host
+        self.port = port
+
+    def __str__(self):
+        return f"{self.host} is resolved for port {self.port} only"
@@ -0,0 +1,115 @@
+import threading
+from collections import deque
+
+from requests.sessions import preferred_clock
+
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 256
+DEFAULT_DECREASE = 0.5
+# a response slower than this times the fastest one seen is congestion
+DEFAULT_LATENCY_FACTOR = 3.0
+
+# statuses telling the server is overloaded
+CONGESTION_STATUS = (429, 503)
+
+
+class HostLimit(object):
+    __slots__ = ("limit", "inflight", "waiting", "min_latency", "decreased_at")
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.inflight = 0
+        self.waiting = deque()
+        self.min_latency = None
+        self.decreased_at = 0
+
+
+class AdaptiveLimiter(object):
+    """Per host in-flight limits adjusted by AIMD.
+
+    Each successful response adds 1 / limit to the limit of its host, about
+    one more slot per round trip of a full window. Congestion, a 429 or 503,
+    a network error or a response slower than latency_factor times the
+    fastest one of the host, multiplies the limit by decrease. Only requests
+    started after the last decrease can decrease it again, so a burst of
+    failures of the same window cuts the limit once.
+    """
+
+    def __init__(
+        self,
+        initial_limit=DEFAULT_INITIAL_LIMIT,
+        min_limit=DEFAULT_MIN_LIMIT,
+        max_limit=DEFAULT_MAX_LIMIT,
+        decrease=DEFAULT_DECREASE,
+        latency_factor=DEFAULT_LATENCY_FACTOR,
+    ):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        h = self._hosts.get(host, None)
+        if h is None:
+            h = self._hosts[host] = HostLimit(
+                max(self.min_limit, min(self.initial_limit, self.max_limit))
+            )
+        return h
+
+    def acquire(self, host, create_counter):
+        """Take a slot of the host now and return None, or return a counter
+        task created by create_counter which is counted when a slot is free.
+        """
+        with self._lock:
+            h = self._host(host)
+            if h.inflight < int(h.limit) and not h.waiting:
+                h.inflight += 1
+                return None
+            counter = create_counter()
+            h.waiting.append(counter)
+            return counter
+
+    def _congested(self, h, latency, status_code, error):
+        if error or status_code in CONGESTION_STATUS:
+            return True
+        if h.min_latency is None or latency < h.min_latency:
+            h.min_latency = latency
+            return False
+        return latency > h.min_latency * self.latency_factor
+
+    def release(self, host, started, status_code=None, error=False):
+        """Free a slot taken at started (preferred_clock), adjust the limit by the
+        outcome of the request.
+
+        Return the limit of the host.
+        """
+        released = []
+        with self._lock:
+            h = self._host(host)
+            h.inflight -= 1
+            latency = preferred_clock() - started
+            if self._congested(h, latency, status_code, error):
+                if started >= h.decreased_at:
+                    h.limit = max(self.min_limit, h.limit * self.decrease)
+                    h.decreased_at = preferred_clock()
+            else:
+                h.limit = min(self.max_limit, h.limit + 1 / h.limit)
+            while h.waiting and h.inflight < int(h.limit):
+                h.inflight += 1
+                released.append(h.waiting.popleft())
+            limit = int(h.limit)
+        for counter in released:
+            counter.count()
+        return limit
+
+    def limits(self):
+        with self._lock:
+            return dict([(k, int(h.limit)) for k, h in self._hosts.items()])
+
+    def waiting(self):
+        with self._lock:
+            return sum([len(h.waiting) for h in self._hosts.values()])
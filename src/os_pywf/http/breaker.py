@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+DEFAULT_FAILURE_RATIO = 0.5
+DEFAULT_MIN_REQUESTS = 10
+DEFAULT_WINDOW = 20
+DEFAULT_RESET_TIMEOUT = 10
+DEFAULT_PROBES = 1
+
+
+class Circuit(object):
+    __slots__ = ("state", "outcomes", "failures", "opened_at", "probes")
+
+    def __init__(self, window):
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window)
+        self.failures = 0
+        self.opened_at = 0
+        self.probes = 0
+
+
+class CircuitBreaker(object):
+    """Per key (host or upstream name) circuit breaker.
+
+    A circuit opens when failures of the last window requests reach
+    failure_ratio, at least min_requests observed. Requests are rejected
+    while it is open, after reset_timeout it is half-open and up to probes
+    requests are let through each reset_timeout. A successful probe closes
+    the circuit, a failed one opens it again.
+
+    A circuit is created by the first failure of its key and dropped when it
+    is closed without failures in its window, keys which do not fail take no
+    memory.
+    """
+
+    def __init__(
+        self,
+        failure_ratio=DEFAULT_FAILURE_RATIO,
+        min_requests=DEFAULT_MIN_REQUESTS,
+        window=DEFAULT_WINDOW,
+        reset_timeout=DEFAULT_RESET_TIMEOUT,
+        probes=DEFAULT_PROBES,
+    ):
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def state(self, key):
+        with self._lock:
+            circuit = self._circuits.get(key, None)
+            return CLOSED if circuit is None else circuit.state
+
+    def allow(self, key):
+        with self._lock:
+            circuit = self._circuits.get(key, None)
+            if circuit is None or circuit.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - circuit.opened_at < self.reset_timeout:
+                if circuit.state == OPEN or circuit.probes >= self.probes:
+                    return False
+            else:
+                # probes which never report back do not block it forever
+                circuit.state = HALF_OPEN
+                circuit.opened_at = now
+                circuit.probes = 0
+            circuit.probes += 1
+            return True
+
+    def record(self, key, ok):
+        """Record an outcome, return True when the circuit is opened by it."""
+        with self._lock:
+            circuit = self._circuits.get(key, None)
+            if circuit is None:
+                if ok:
+                    return False
+                circuit = self._circuits[key] = Circuit(self.window)
+            if circuit.state == HALF_OPEN:
+                if ok:
+                    self._circuits.pop(key)
+                    return False
+                circuit.state = OPEN
+                circuit.opened_at = time.monotonic()
+                return True
+            if circuit.state == OPEN:
+                return False
+            if len(circuit.outcomes) == circuit.outcomes.maxlen:
+                circuit.failures -= not circuit.outcomes[0]
+            circuit.outcomes.append(ok)
+            circuit.failures += not ok
+            n = len(circuit.outcomes)
+            if n >= self.min_requests and circuit.failures >= n * self.failure_ratio:
+                circuit.state = OPEN
+                circuit.opened_at = time.monotonic()
+                return True
+            if circuit.failures == 0:
+                self._circuits.pop(key)
+            return False
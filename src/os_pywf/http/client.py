@@ -1,5 +1,7 @@
 import logging
 import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
 from io import BytesIO
 from typing import Any, Union
@@ -11,11 +13,7 @@ from requests._internal_utils import to_native_string
 from requests.auth import _basic_auth_str
 from requests.compat import cookielib
 from requests.cookies import RequestsCookieJar, cookiejar_from_dict, merge_cookies
-from requests.exceptions import (
-    ChunkedEncodingError,
-    ContentDecodingError,
-    TooManyRedirects,
-)
+from requests.exceptions import TooManyRedirects
 from requests.hooks import default_hooks, dispatch_hook
 from requests.models import DEFAULT_REDIRECT_LIMIT
 from requests.sessions import (
@@ -38,18 +36,71 @@ from urllib3.response import HTTPResponse
 from urllib3.util import parse_url
 
 import os_pywf
-from os_pywf.exceptions import Failure, WFException
-from os_pywf.utils import MILLION, create_timer_task, extract_cookies_to_jar
+from os_pywf import tracing
+from os_pywf.exceptions import CircuitOpenError, Failure, ResolvedPortError, WFException
+from os_pywf.http.adaptive import AdaptiveLimiter
+from os_pywf.http.headers import ResponseHeaders, multi_items
+from os_pywf.http.hedge import DEFAULT_HEDGE_RATIO, HEDGEABLE_METHODS, Hedger
+from os_pywf.http.priority import DEFAULT_AGING, PriorityDispatcher
+from os_pywf.http.ratelimit import RateLimiter
+from os_pywf.http.raw import (
+    RESPONSE_RAW,
+    RawResponse,
+    load_raw_response,
+    release_raw_response,
+)
+from os_pywf.http.resolve import (
+    DEFAULT_PREWARM_WORKERS,
+    ports_from_resolve,
+    prewarm,
+    upstreams_from_resolve,
+)
+from os_pywf.http.upstream import LEAST_LOADED
+from os_pywf.profiling import profiled
+from os_pywf.utils import (
+    MILLION,
+    LRUCache,
+    Stats,
+    create_timer_task,
+    extract_cookies_to_jar,
+)
 
 HTTP_10 = "HTTP/1.0"
 HTTP_11 = "HTTP/1.1"
 
+DEFAULT_REDIRECT_CACHE_SIZE = 1000
+PERMANENT_REDIRECT_CODES = (codes.moved_permanently, codes.permanent_redirect)
+CACHEABLE_REDIRECT_METHODS = ("GET", "HEAD")
+# dropped when a request is copied to another host
+AUTH_HEADERS = ("Authorization", "Proxy-Authorization")
+
+# ms, warmed up connections are kept for the workload, same as the Workflow
+# default of HTTP
+WARMUP_KEEP_ALIVE = 60 * 1000
+
+# run callback/errback with pywf go task on compute threads
+CALLBACK_COMPUTE = "compute"
+
 logger = logging.getLogger(__name__)
 
 session_redirect_mixin = SessionRedirectMixin()
 session_redirect_mixin.trust_env = False
 
 
+def _port_of(parsed):
+    return parsed.port or (443 if parsed.scheme.lower() == "https" else 80)
+
+
+def _root_url(url):
+    p = urlparse(url)
+    return f"{p.scheme}://{p.netloc}/"
+
+
+@profiled("cookies")
+def extract_cookies(jar, request, response):
+    extract_cookies_to_jar(jar, request, response)
+
+
 def default_user_agent():
     return f"os-pywf/{os_pywf.__version__}"
 
@@ -65,6 +116,7 @@ def default_headers():
     )
 
 
+@profiled("build_response")
 def _build_response(
     task: pywf.HttpTask, request: PreparedRequest
 ) -> Union[Response, Failure]:
@@ -78,8 +130,8 @@ def _build_response(
     resp = task.get_resp()
 
     response.status_code = int(resp.get_status_code())
-    headers = dict(resp.get_headers())
-    response.headers = CaseInsensitiveDict(headers)
+    headers = resp.get_headers()
+    response.headers = ResponseHeaders(headers)
     response.encoding = get_encoding_from_headers(response.headers)
     response.reason = resp.get_reason_phrase()
     extract_cookies_to_jar(response.cookies, request, response)
@@ -103,6 +155,151 @@ def build_response(
         return Failure(e, None)
 
 
+@profiled("build_response")
+def build_raw_response(
+    task: pywf.HttpTask, request: PreparedRequest
+) -> Union[RawResponse, Failure]:
+    if task.get_state() != 0:
+        return Failure(
+            WFException(task.get_state(), task.get_error()),
+            RawResponse(None, request),
+        )
+    return RawResponse(task.get_resp(), request)
+
+
+def pack_request(request: PreparedRequest) -> tuple:
+    return (request.method, request.url, list(request.headers.items()), request.body)
+
+
+def unpack_request(packed: tuple) -> PreparedRequest:
+    method, url, headers, body = packed
+    request = PreparedRequest()
+    request.method = method
+    request.url = url
+    request.headers = CaseInsensitiveDict(headers)
+    request.body = body
+    request.hooks = default_hooks()
+    return request
+
+
+def pack_response(response: Union[Response, Failure, None]) -> tuple:
+    if isinstance(response, Failure):
+        return (
+            "failure",
+            response.exception,
+            pack_response(response.value),
+        )
+    elif isinstance(response, Response):
+        return (
+            "response",
+            response.url,
+            response.status_code,
+            response.reason,
+            multi_items(response.headers),
+            response.encoding,
+            response.elapsed,
+            response.content,
+            [pack_response(r) for r in response.history],
+        )
+    elif isinstance(response, RawResponse):
+        return (
+            "response",
+            response.url,
+            response.status_code,
+            response.reason,
+            multi_items(response.headers),
+            response.encoding,
+            response.elapsed,
+            response.content,
+            [pack_response(r) for r in response.history],
+        )
+    elif isinstance(response, RedirectRecord):
+        return (
+            "redirect",
+            response.status_code,
+            response.reason,
+            response.url,
+            multi_items(response.headers),
+        )
+    return None
+
+
+def unpack_response(
+    packed: tuple, request: PreparedRequest
+) -> Union[Response, Failure, None]:
+    if packed is None:
+        return None
+    if packed[0] == "failure":
+        return Failure(packed[1], unpack_response(packed[2], request))
+    if packed[0] == "redirect":
+        return RedirectRecord(*packed[1:4], ResponseHeaders(packed[4]))
+    response = Response()
+    (
+        _,
+        response.url,
+        response.status_code,
+        response.reason,
+        headers,
+        response.encoding,
+        response.elapsed,
+        response._content,
+        history,
+    ) = packed
+    response._content_consumed = True
+    response.headers = ResponseHeaders(headers)
+    response.request = request
+    response.history = [unpack_response(r, request) for r in history]
+    return response
+
+
+def call_packed(do, packed_request: tuple, packed_response: tuple):
+    """Invoke callback/errback in worker process with unpacked request/response."""
+    request = unpack_request(packed_request)
+    return do(None, request, unpack_response(packed_response, request))
+
+
+class TaskData(object):
+    """Bookkeeping of a request kept as task user data until the callback."""
+
+    __slots__ = ("user_data", "request", "history", "retries")
+
+    def __init__(self, user_data, request):
+        self.user_data = user_data
+        self.request = request
+        self.history = None
+        self.retries = 1
+
+
+class RedirectRecord(object):
+    """Status, URL and headers of a redirect response for lean history."""
+
+    __slots__ = ("status_code", "reason", "url", "headers")
+
+    def __init__(self, status_code, reason, url, headers):
+        self.status_code = status_code
+        self.reason = reason
+        self.url = url
+        self.headers = headers
+
+    def __repr__(self):
+        return f"<RedirectRecord [{self.status_code}]>"
+
+
+class Batch(object):
+    """Requests returned by callback/errback which run concurrently.
+
+    At most concurrency (default the session fanout_concurrency, 0 means
+    all) requests are in flight. callback is invoked with a list of
+    (request, response) in the order of requests when all are done, its
+    return value is scheduled as callback's.
+    """
+
+    def __init__(self, requests, callback=None, concurrency=None):
+        self.requests = list(requests)
+        self.callback = callback
+        self.concurrency = concurrency
+
+
 class Session(object):
 
     __attrs__ = [
@@ -122,6 +319,23 @@ class Session(object):
         "max_size",
         "callback",
         "errback",
+        "callback_executor",
+        "rate",
+        "rate_per_host",
+        "redirect_cache_size",
+        "upstreams",
+        "hedge_delay",
+        "hedge_ratio",
+        "circuit_breaker",
+        "fanout_concurrency",
+        "max_inflight",
+        "priority_aging",
+        "lean_history",
+        "response_class",
+        "raw_cookies",
+        "raw_hooks",
+        "adaptive_limiter",
+        "resolve",
     ]
 
     def __init__(
@@ -142,6 +356,23 @@ class Session(object):
         max_size=None,
         callback=None,
         errback=None,
+        callback_executor=None,
+        rate=None,
+        rate_per_host=None,
+        redirect_cache_size=DEFAULT_REDIRECT_CACHE_SIZE,
+        upstreams=None,
+        hedge_delay=None,
+        hedge_ratio=DEFAULT_HEDGE_RATIO,
+        circuit_breaker=None,
+        fanout_concurrency=0,
+        max_inflight=None,
+        priority_aging=DEFAULT_AGING,
+        lean_history=False,
+        response_class=None,
+        raw_cookies=False,
+        raw_hooks=False,
+        adaptive_limiter=None,
+        resolve=None,
     ):
         self.headers = default_headers() if headers is None else headers
         self.cookies = cookiejar_from_dict({}) if cookies is None else cookies
@@ -160,6 +391,115 @@ class Session(object):
         self.max_size = max_size
         self.callback = callback
         self.errback = errback
+        self.callback_executor = callback_executor
+        self.stats = Stats()
+        self.rate = rate
+        self.rate_per_host = rate_per_host
+        self.rate_limiter = None
+        if rate or rate_per_host:
+            self.rate_limiter = RateLimiter(
+                rate=rate, rate_per_host=rate_per_host, cancel=self.cancel_event
+            )
+        self.redirect_cache_size = redirect_cache_size
+        self.redirect_cache = None
+        if redirect_cache_size:
+            self.redirect_cache = LRUCache(redirect_cache_size)
+        self.upstreams = {}
+        for upstream in upstreams or ():
+            upstream.register()
+            self.upstreams[upstream.name] = upstream
+        self.hedge_delay = hedge_delay
+        self.hedge_ratio = hedge_ratio
+        self.hedger = None
+        if hedge_delay is not None:
+            self.hedger = Hedger(hedge_delay, hedge_ratio)
+        self.circuit_breaker = circuit_breaker
+        self.fanout_concurrency = fanout_concurrency
+        self.max_inflight = max_inflight
+        self.priority_aging = priority_aging
+        self.lean_history = lean_history
+        if response_class not in (None, RESPONSE_RAW):
+            raise ValueError(f"not supported response class {response_class}")
+        self.response_class = response_class
+        self.raw_cookies = raw_cookies
+        self.raw_hooks = raw_hooks
+        self.dispatcher = None
+        if max_inflight:
+            self.dispatcher = PriorityDispatcher(max_inflight, priority_aging)
+        if adaptive_limiter is True:
+            adaptive_limiter = AdaptiveLimiter()
+        self.adaptive_limiter = adaptive_limiter
+        self.resolve = resolve
+        self.resolved_hosts = set()
+        self.resolved_ports = ports_from_resolve(resolve or {})
+        self._add_resolved(upstreams_from_resolve(resolve or {}))
+
+    def _add_resolved(self, upstreams):
+        for upstream in upstreams:
+            if upstream.name in self.upstreams:
+                continue
+            upstream.register()
+            self.upstreams[upstream.name] = upstream
+            self.resolved_hosts.add(upstream.name)
+
+    def prewarm_dns(self, hosts, workers=DEFAULT_PREWARM_WORKERS):
+        """Resolve hosts concurrently, requests of them skip DNS lookup.
+
+        Hosts of upstreams or of the resolve map are not resolved again.
+        Return the number of resolved hosts.
+        """
+        hosts = set([h.lower() for h in hosts]) - set(self.upstreams.keys())
+        upstreams, failed = prewarm(hosts, workers)
+        self._add_resolved(upstreams)
+        self.stats.inc("dns_prewarm_resolved", len(upstreams))
+        self.stats.inc("dns_prewarm_failed", len(failed))
+        return len(upstreams)
+
+    def warmup(self, urls, connections_per_host=1, callback=None) -> pywf.SubTask:
+        """Open and park keep-alive connections before the workload.
+
+        connections_per_host HEAD requests to the root of each distinct
+        scheme and host of urls are sent at the same time, so each one
+        opens a connection. callback is invoked with a dict of base URL to
+        the seconds of each request, connect, TLS handshake and the first
+        request, None when failed.
+        """
+        bases = list(dict.fromkeys([_root_url(url) for url in urls]))
+        times = dict([(base, []) for base in bases])
+        lock = threading.Lock()
+
+        def _done(base, start):
+            def _callback(task):
+                ok = task.get_state() == 0
+                elapsed = preferred_clock() - start if ok else None
+                self.stats.inc("warmup_connections" if ok else "warmup_failures")
+                with lock:
+                    times[base].append(elapsed)
+
+            return _callback
+
+        def _finished(p):
+            if callback is not None:
+                callback(times)
+
+        def _enter(t):
+            if self.canceled():
+                return
+            parallel = pywf.create_parallel_work(_finished)
+            start = preferred_clock()
+            for base in bases:
+                # the requests of it fail, no connection to warm up
+                if self._resolved_port_error(urlparse(base)) is not None:
+                    continue
+                request = self.prepare_request(Request("HEAD", base))
+                for _ in range(connections_per_host):
+                    task = self.create_http_task(request, _done(base, start))
+                    if not self.disable_keepalive:
+                        task.set_keep_alive(WARMUP_KEEP_ALIVE)
+                    parallel.add_series(pywf.create_series_work(task, None))
+            pywf.series_of(t).push_front(parallel)
+
+        return pywf.create_timer_task(0, _enter)
 
     def cancel(self):
         if not self.canceled():
@@ -172,6 +512,17 @@ class Session(object):
         if not self.canceled():
             self.cancel_event.wait()
 
+    @profiled("cookies")
+    def _merge_cookies(self, url, cookies):
+        """Cookies of the session merged with the cookies, a new jar."""
+        if hasattr(self.cookies, "load_url"):  # lazy loaded jar
+            self.cookies.load_url(url)
+        merged = merge_cookies(RequestsCookieJar(), self.cookies)
+        if cookies is not None:
+            merge_cookies(merged, cookies)
+        return merged
+
+    @profiled("prepare_request")
     def prepare_request(self, request: Request) -> PreparedRequest:
 
         cookies = request.cookies or {}
@@ -179,9 +530,7 @@ class Session(object):
         if not isinstance(cookies, cookielib.CookieJar):
             cookies = cookiejar_from_dict(cookies)
 
-        merged_cookies = merge_cookies(
-            merge_cookies(RequestsCookieJar(), self.cookies), cookies
-        )
+        merged_cookies = self._merge_cookies(request.url, cookies)
 
         auth = request.auth
 
@@ -232,13 +581,21 @@ class Session(object):
 
     def _request(self, request: Request, **kwargs):
         prep = self.prepare_request(request)
+        if hasattr(request, "priority"):
+            kwargs.setdefault("priority", request.priority)
         return self.send(prep, **kwargs)
 
     def retry(self, task, request, **kwargs):
         retry_delay = kwargs.get("retry_delay", self.retry_delay)
+        trace = kwargs.get("trace", None)
+        if trace is not None:
+            tracing.TRACER.instant("retry", trace, url=request.url)
         if retry_delay > 0:
+            scheduled = tracing.now_ns() if trace is not None else None
 
             def _retry(t):
+                if scheduled is not None:
+                    tracing.TRACER.span("retry wait", trace, scheduled)
                 s = pywf.series_of(t)
                 n = self.send(
                     request,
@@ -253,24 +610,60 @@ class Session(object):
         else:
             t = self.send(request, **kwargs)
         udata = task.get_user_data()
-        retries = udata.get("_retries", 1)
-        udata["_retries"] = retries + 1
+        udata.retries += 1
         t.set_user_data(udata)
         series = pywf.series_of(task)
         series.push_front(t)
 
+    def _copy_request(self, request: PreparedRequest, url: str) -> PreparedRequest:
+        """Shallow copy of the request with new url and Cookie header.
+
+        Only headers are copied, body and hooks are shared. Cookies are the
+        cookies of the request merged with the session cookies. Credentials
+        are not sent to another host.
+        """
+        p = PreparedRequest()
+        p.method = request.method
+        p.url = url
+        p.headers = request.headers.copy()
+        if session_redirect_mixin.should_strip_auth(request.url, url):
+            for header in AUTH_HEADERS:
+                p.headers.pop(header, None)
+        p.body = request.body
+        p.hooks = request.hooks
+        p._body_position = request._body_position
+        p.headers.pop("Cookie", None)
+        cookies = RequestsCookieJar()
+        if request._cookies is not None:
+            merge_cookies(cookies, request._cookies)
+        if hasattr(self.cookies, "load_url"):
+            self.cookies.load_url(url)
+        merge_cookies(cookies, self.cookies)
+        p._cookies = cookies
+        p.prepare_cookies(cookies)
+        return p
+
+    def _rewrite_permanent_redirect(self, request: PreparedRequest) -> PreparedRequest:
+        url = request.url
+        checked = set()
+        while url not in checked:
+            target = self.redirect_cache.get(url)
+            if target is None:
+                break
+            checked.add(url)
+            url = target
+        if url == request.url:
+            return request
+        self.stats.inc("redirect_cache_hits")
+        return self._copy_request(request, url)
+
     def redirect(self, task, request, response, **kwargs):
         url = session_redirect_mixin.get_redirect_target(response)
         previous_fragment = urlparse(request.url).fragment
-        prepared_request = request.copy()
 
-        try:
-            response.content
-        except (ChunkedEncodingError, ContentDecodingError, RuntimeError):
-            response.raw.read(decode_content=False)
-        response.close()
+        # the 3xx body is not read, it can still be read lazily from history
         if url.startswith("//"):
-            parsed_rurl = urlparse(resp.url)
+            parsed_rurl = urlparse(response.url)
             url = ":".join([to_native_string(parsed_rurl.scheme), url])
         parsed = urlparse(url)
         if parsed.fragment == "" and previous_fragment:
@@ -284,7 +677,8 @@ class Session(object):
         else:
             url = requote_uri(url)
 
-        prepared_request.url = to_native_string(url)
+        # cookies of the response are already extracted to session cookies
+        prepared_request = self._copy_request(request, to_native_string(url))
         session_redirect_mixin.rebuild_method(prepared_request, response)
         if response.status_code not in (
             codes.temporary_redirect,
@@ -296,11 +690,6 @@ class Session(object):
             prepared_request.body = None
 
         headers = prepared_request.headers
-        headers.pop("Cookie", None)
-
-        extract_cookies_to_jar(prepared_request._cookies, request, response)
-        merge_cookies(prepared_request._cookies, self.cookies)
-        prepared_request.prepare_cookies(prepared_request._cookies)
         session_redirect_mixin.rebuild_auth(prepared_request, response)
         rewindable = prepared_request._body_position is not None and (
             "Content-Length" in headers or "Transfer-Encoding" in headers
@@ -309,6 +698,21 @@ class Session(object):
         if rewindable:
             rewind_body(prepared_request)
 
+        if (
+            self.redirect_cache is not None
+            and response.status_code in PERMANENT_REDIRECT_CODES
+            and request.method in CACHEABLE_REDIRECT_METHODS
+        ):
+            self.redirect_cache.set(request.url, prepared_request.url)
+
+        trace = kwargs.get("trace", None)
+        if trace is not None:
+            tracing.TRACER.instant(
+                "redirect",
+                trace,
+                status=response.status_code,
+                url=prepared_request.url,
+            )
         udata = task.get_user_data()
         t = self.send(prepared_request, **kwargs)
         t.set_user_data(udata)
@@ -322,52 +726,105 @@ class Session(object):
     ) -> pywf.HttpTask:
 
         if isinstance(request, Request):
-            return self._request(reqeust, **kwargs)
+            return self._request(request, **kwargs)
+
+        if (
+            self.redirect_cache is not None
+            and request.method in CACHEABLE_REDIRECT_METHODS
+            and kwargs.get("allow_redirects", self.allow_redirects)
+        ):
+            request = self._rewrite_permanent_redirect(request)
 
         extras = {"_start": preferred_clock()}  # [TODO] not the real start time
 
-        def _callback(task):
+        tracer = tracing.TRACER
+        trace = None
+        if tracer is not None:
+            if "trace" not in kwargs:
+                kwargs["trace"] = tracer.new_trace()
+            trace = kwargs["trace"]
+            if trace is not None:
+                extras["_queued"] = tracing.now_ns()
+
+        def _handle(task, response):
+            self._release_slot(extras)
+            if "_host_slot" in extras:
+                self._adjust_limit(request, response, extras.pop("_host_slot"))
+            if "_sent" in extras:
+                tracer.span(
+                    "network",
+                    trace,
+                    extras.pop("_sent"),
+                    method=request.method,
+                    url=request.url,
+                )
             if self.canceled():
                 series = pywf.series_of(task)
                 if not series.is_canceled():
                     series.cancel()
                 return
             udata = task.get_user_data()
-            if not isinstance(udata, dict) or (
-                "_user_data" not in udata and "_request" not in udata
-            ):
-                task.set_user_data({"_user_data": udata, "_request": request})
+            if not isinstance(udata, TaskData):
+                udata = TaskData(udata, request)
+                task.set_user_data(udata)
             elapsed = preferred_clock() - extras["_start"]
-            response = build_response(task, request)
-            udata = task.get_user_data()
             do = kwargs.get("callback", self.callback)
+            rejected = isinstance(response, Failure) and isinstance(
+                response.exception, (CircuitOpenError, ResolvedPortError)
+            )
+            if self.circuit_breaker is not None and not rejected:
+                self._record_outcome(request, response)
             if isinstance(response, Failure):  # [TODO] ignore specified exceptions
+                self.stats.inc("failures")
                 response.value.elapsed = timedelta(seconds=elapsed)
                 do = kwargs.get("errback", self.errback)
                 if do is None:
                     do = kwargs.get("callback", self.callback)
-                retries = udata.get("_retries", 1)
-                if retries < kwargs.get("max_retries", self.max_retries):
+                if not rejected and udata.retries < kwargs.get(
+                    "max_retries", self.max_retries
+                ):
+                    self.stats.inc("retries")
                     self.retry(task, request, **kwargs)
                     do = None
             else:
+                self.stats.inc("responses")
+                self.stats.inc(f"status_{response.status_code // 100}xx")
                 response.elapsed = timedelta(seconds=elapsed)
-                response = dispatch_hook("response", request.hooks, response, **kwargs)
-                if response.history:
-                    for resp in response.history:
-                        extract_cookies_to_jar(self.cookies, resp.request, resp)
-
-                extract_cookies_to_jar(self.cookies, request, response)
-                history = udata.get("_history", [])
-                udata["_history"] = history
+                if not raw or kwargs.get("raw_hooks", self.raw_hooks):
+                    response = dispatch_hook(
+                        "response", request.hooks, response, **kwargs
+                    )
+                if not raw:
+                    if response.history:
+                        for resp in response.history:
+                            extract_cookies(self.cookies, resp.request, resp)
+                    extract_cookies(self.cookies, request, response)
+                elif kwargs.get("raw_cookies", self.raw_cookies):
+                    extract_cookies(self.cookies, request, response)
+                if udata.history is None:
+                    udata.history = []
+                history = udata.history
                 if not response.is_redirect:
                     response.history = history
-                    response.content
+                    if not raw:
+                        response.content
                 elif kwargs.get("allow_redirects", self.allow_redirects):
-                    history.append(response)
-                    response.history = history[:-1]
+                    response.history = history[:]
+                    # the pywf response of raw response is released soon
+                    if raw or kwargs.get("lean_history", self.lean_history):
+                        history.append(
+                            RedirectRecord(
+                                response.status_code,
+                                response.reason,
+                                response.url,
+                                response.headers,
+                            )
+                        )
+                    else:
+                        history.append(response)
                     max_redirects = kwargs.get("max_redirects", self.max_redirects)
                     if len(response.history) < max_redirects:
+                        self.stats.inc("redirects")
                         self.redirect(task, request, response, **kwargs)
                         do = None
                     else:
@@ -383,57 +840,555 @@ class Session(object):
                         )
 
             if do:
-                _request = udata["_request"]
-                task.set_user_data(udata["_user_data"])
-                results = None
-                try:
-                    results = do(task, _request, response)
-                except Exception as e:
-                    logger.error(
-                        f"unexpected exception from {do.__module__}.{do.__name__} {e}"
-                    )
+                _request = udata.request
+                task.set_user_data(udata.user_data)
+                executor = kwargs.get("callback_executor", self.callback_executor)
+                series = pywf.series_of(task)
+                if executor is None:
+                    if trace is not None:
+                        start = tracing.now_ns()
+                    results = self._invoke(do, task, _request, response)
+                    if trace is not None:
+                        tracer.span(
+                            "callback",
+                            trace,
+                            start,
+                            callback=getattr(do, "__name__", ""),
+                        )
+                    if raw:
+                        release_raw_response(response)
+                    self._schedule(series, results)
+                else:
+                    if raw:
+                        load_raw_response(response)
+                    self._dispatch(executor, series, do, _request, response)
+
+        raw = kwargs.get("response_class", self.response_class) == RESPONSE_RAW
+        build = build_raw_response if raw else build_response
+
+        def _callback(task):
+            _handle(task, build(task, request))
+
+        if self.resolved_ports and not select_proxy(
+            request.url, kwargs.get("proxies", self.proxies)
+        ):
+            error = self._resolved_port_error(urlparse(request.url))
+            if error is not None:
+                return self._reject(request, _handle, error)
+
+        if (
+            self.hedger is not None
+            and kwargs.get("hedge", True)
+            and request.method in HEDGEABLE_METHODS
+        ):
+            task = self._hedge(request, _handle, build, **kwargs)
+        elif self._create_on_start(request, **kwargs):
+            task = self._start_http_task(request, _callback, **kwargs)
+        else:
+            task = self.create_http_task(request, _callback, **kwargs)
+        if trace is not None:
+            task = self._trace_queue(task, trace, extras)
+        priority = kwargs.get("priority", getattr(request, "priority", 0))
+        task = self._gate(task, request, priority, extras)
+        if self.circuit_breaker is not None:
+            task = self._fail_fast(task, request, _handle)
+        return task
+
+    def _gate(self, task, request, priority, extras) -> pywf.SubTask:
+        """Start the task after the rate limiter, the priority dispatcher and
+        the adaptive limiter let it go."""
+        # a host slot is taken after the wait in the priority queue, its
+        # latency is of the request only
+        if self.adaptive_limiter is not None:
+            task = self._adapt(task, request, priority, extras)
+        if self.dispatcher is not None:
+            task = self._prioritize(task, priority, extras)
+        if self.rate_limiter is not None:
+            task = self._rate_limit(task, request)
+        return task
+
+    def _record_outcome(self, request, response):
+        key = urlparse(request.url).netloc
+        ok = not (
+            isinstance(response, Failure)
+            and isinstance(response.exception, WFException)
+        )
+        if self.circuit_breaker.record(key, ok):
+            self.stats.inc("circuits_opened")
+            logger.warning(f"circuit of {key} is open")
+
+    def _fail_fast(self, task, request, handle) -> pywf.SubTask:
+        """Reject the request with CircuitOpenError when the circuit is open."""
+        key = urlparse(request.url).netloc
 
-                def _task(t):
-                    if isinstance(t, str):
-                        return self.get(t)
-                    elif isinstance(t, PreparedRequest):
-                        return self.send(t)  # send without session param
-                    elif isinstance(t, Request):
-                        return self.send(t)
-                    elif isinstance(t, pywf.SubTask):
-                        return t
-                    logger.warn(f"not supported type {type(t)}")
-
-                def _tasks(s):
-                    r = []
-                    if isinstance(s, list):
-                        r = [_task(t) for t in s]
-                    r = [_task(s)]
-                    return [t for t in r if t is not None]
-
-                if results is None:
+        def _enter(t):
+            if self.canceled():
+                return
+            if self.circuit_breaker.allow(key):
+                task.set_user_data(t.get_user_data())
+                pywf.series_of(t).push_front(task)
+                return
+            self.stats.inc("circuit_rejected")
+            response = Response()
+            response.url = request.url
+            response.request = request
+            handle(t, Failure(CircuitOpenError(key), response))
+
+        return pywf.create_timer_task(0, _enter)
+
+    def _resolved_port_error(self, parsed):
+        # Workflow upstreams are matched by host, all ports of the host would
+        # go to the resolved port
+        port = self.resolved_ports.get(parsed.hostname, None)
+        if port is not None and port != _port_of(parsed):
+            return ResolvedPortError(parsed.hostname, port)
+        return None
+
+    def _reject(self, request, handle, exception) -> pywf.SubTask:
+        """Fail the request with exception when the series reaches it."""
+
+        def _enter(t):
+            if self.canceled():
+                return
+            response = Response()
+            response.url = request.url
+            response.request = request
+            handle(t, Failure(exception, response))
+
+        return pywf.create_timer_task(0, _enter)
+
+    def _hedge(self, request, handle, build, **kwargs) -> pywf.SubTask:
+        """Send another copy of the request when no response after a delay.
+
+        Attempts are started as their own series, a counter task in the
+        series of the caller is counted by the first response, then the
+        response is handled with the counter as task. A failure only wins
+        when no other attempt is in flight. Hedges go through the same gates
+        as the request, they are not sent when the request won meanwhile.
+        """
+        hedger = self.hedger
+        lock = threading.Lock()
+        state = {"winner": None, "inflight": 1, "gate": None}
+
+        def _attempt(start, hedged, extras=None):
+            def _arrived(t):
+                response = build(t, request)
+                load_raw_response(response)
+                if extras is not None:
+                    self._release_slot(extras)
+                    if "_host_slot" in extras:
+                        self._adjust_limit(request, response, extras.pop("_host_slot"))
+                failed = isinstance(response, Failure)
+                if not failed:
+                    hedger.observe(preferred_clock() - start)
+                with lock:
+                    state["inflight"] -= 1
+                    if state["winner"] is not None:
+                        return
+                    if failed and state["inflight"] > 0:
+                        return
+                    state["winner"] = response
+                if hedged:
+                    self.stats.inc("hedge_wins")
+                state["gate"].count()
+
+            return _arrived
+
+        def _fire(t):
+            if self.canceled():
+                return
+            with lock:
+                if state["winner"] is not None or not hedger.allow():
                     return
-                pre, post = [], []
-                if isinstance(results, tuple):
-                    l = len(results)
-                    if l >= 1:
-                        pre = _tasks(results[0])
-                    if l >= 2:
-                        post = _tasks(results[1])
-                else:
-                    pre = _tasks(results)
-                series = pywf.series_of(task)
-                list(map(series.push_front, pre[::-1]))
-                list(map(series.push_back, post))
+                state["inflight"] += 1
+            self.stats.inc("hedges")
+            extras = {}
+
+            def _start(t):
+                with lock:
+                    skip = state["winner"] is not None or self.canceled()
+                    if skip:
+                        state["inflight"] -= 1
+                if skip:
+                    self._release_slot(extras)
+                    self._release_host_slot(extras)
+                    return
+                hedge = self.create_http_task(
+                    request, _attempt(preferred_clock(), True, extras), **kwargs
+                )
+                pywf.series_of(t).push_front(hedge)
+
+            priority = kwargs.get("priority", getattr(request, "priority", 0))
+            gated = self._gate(
+                pywf.create_timer_task(0, _start), request, priority, extras
+            )
+            pywf.create_series_work(gated, None).start()
+
+        def _released(t):
+            handle(t, state["winner"])
+
+        def _enter(t):
+            if self.canceled():
+                return
+            gate = pywf.create_counter_task(1, _released)
+            gate.set_user_data(t.get_user_data())
+            state["gate"] = gate
+            pywf.series_of(t).push_front(gate)
+            hedger.add()
+            task = self.create_http_task(
+                request, _attempt(preferred_clock(), False), **kwargs
+            )
+            task.start()
+            # the timer is not canceled when the first attempt wins, it just
+            # does nothing when it fires
+            delay = hedger.delay()
+            if delay is not None:
+                pywf.create_timer_task(int(delay * MILLION), _fire).start()
+
+        return pywf.create_timer_task(0, _enter)
+
+    def _create_on_start(self, request, **kwargs):
+        """Whether the HTTP task is better created when it starts.
+
+        A streamed body is copied into the task, tasks waiting in a series
+        or a queue should not hold their copies. A least-loaded server is
+        selected with the load of the time the request is sent.
+        """
+        if request.body and not isinstance(request.body, (bytes, str)):
+            return True
+        if not self.upstreams or select_proxy(
+            request.url, kwargs.get("proxies", self.proxies)
+        ):
+            return False
+        upstream = self.upstreams.get(urlparse(request.url).hostname, None)
+        return upstream is not None and upstream.policy == LEAST_LOADED
+
+    def _start_http_task(self, request, cb, **kwargs) -> pywf.SubTask:
+        """Create the HTTP task when the series reaches it."""
+
+        def _enter(t):
+            if self.canceled():
+                return
+            task = self.create_http_task(request, cb, **kwargs)
+            task.set_user_data(t.get_user_data())
+            pywf.series_of(t).push_front(task)
+
+        return pywf.create_timer_task(0, _enter)
+
+    def _trace_queue(self, task, trace, extras) -> pywf.SubTask:
+        """Record the time from send to the start of the task as queue span."""
+
+        def _enter(t):
+            if self.canceled():
+                return
+            extras["_sent"] = tracing.now_ns()
+            tracing.TRACER.span("queue", trace, extras["_queued"], extras["_sent"])
+            task.set_user_data(t.get_user_data())
+            pywf.series_of(t).push_front(task)
+
+        return pywf.create_timer_task(0, _enter)
+
+    def _prioritize(self, task, priority, extras) -> pywf.SubTask:
+        """Start the task when the dispatcher hands it a slot."""
+
+        def _released(t):
+            if self.canceled():
+                self._release_slot(extras)
+                self._release_host_slot(extras)
+                series = pywf.series_of(t)
+                if not series.is_canceled():
+                    series.cancel()
+            elif "_host_slot" in extras:
+                # the host slot was taken first, its latency starts now
+                extras["_host_slot"] = preferred_clock()
+
+        def _enter(t):
+            if self.canceled():
+                self._release_host_slot(extras)
+                return
+            task.set_user_data(t.get_user_data())
+            series = pywf.series_of(t)
+            series.push_front(task)
+            extras["_slot"] = True
+            counter = self.dispatcher.acquire(
+                priority, lambda: pywf.create_counter_task(1, _released)
+            )
+            if counter is None:
+                if "_host_slot" in extras:
+                    extras["_host_slot"] = preferred_clock()
+            else:
+                self.stats.inc("priority_waits")
+                series.push_front(counter)
+
+        return pywf.create_timer_task(0, _enter)
+
+    def _release_slot(self, extras):
+        """Give back the slot of the priority dispatcher, if taken."""
+        if extras.get("_slot", False):
+            extras["_slot"] = False
+            self.dispatcher.release()
+            return True
+        return False
+
+    def _release_host_slot(self, extras):
+        """Give back the slot of the adaptive limiter, if taken."""
+        if "_host_slot" in extras:
+            self.adaptive_limiter.release(extras["_host"], extras.pop("_host_slot"))
+
+    def _adapt(self, task, request, priority, extras) -> pywf.SubTask:
+        """Start the task when its host has a free slot.
+
+        The slot of the priority dispatcher is given back while waiting, a
+        slow host does not hold slots of the other hosts, and taken again
+        when the host slot is free.
+        """
+        host = urlparse(request.url).netloc
+
+        def _released(t):
+            extras["_host_slot"] = preferred_clock()
+            if self.canceled():
+                self._release_host_slot(extras)
+                self._release_slot(extras)
+                series = pywf.series_of(t)
+                if not series.is_canceled():
+                    series.cancel()
+
+        def _enter(t):
+            if self.canceled():
+                self._release_slot(extras)
+                return
+            series = pywf.series_of(t)
+            extras["_host"] = host
+            counter = self.adaptive_limiter.acquire(
+                host, lambda: pywf.create_counter_task(1, _released)
+            )
+            if counter is None:
+                extras["_host_slot"] = preferred_clock()
+                task.set_user_data(t.get_user_data())
+                series.push_front(task)
+                return
+            self.stats.inc("adaptive_waits")
+            start = task
+            if self._release_slot(extras):
+                start = self._prioritize(task, priority, extras)
+            start.set_user_data(t.get_user_data())
+            series.push_front(start)
+            series.push_front(counter)
+
+        return pywf.create_timer_task(0, _enter)
+
+    def _adjust_limit(self, request, response, started):
+        host = urlparse(request.url).netloc
+        if isinstance(response, Failure):
+            self.adaptive_limiter.release(
+                host, started, error=isinstance(response.exception, WFException)
+            )
+        else:
+            self.adaptive_limiter.release(
+                host, started, status_code=response.status_code
+            )
+
+    def _rate_limit(self, task, request) -> pywf.SubTask:
+        host = urlparse(request.url).netloc
+
+        def _released(t):
+            if self.canceled():
+                series = pywf.series_of(t)
+                if not series.is_canceled():
+                    series.cancel()
+
+        def _enter(t):
+            if self.canceled():
+                return
+            task.set_user_data(t.get_user_data())
+            series = pywf.series_of(t)
+            series.push_front(task)
+            if self.rate_limiter.acquire(host):
+                return
+            self.stats.inc("rate_limited")
+            counter = pywf.create_counter_task(1, _released)
+            series.push_front(counter)
+            self.rate_limiter.wait(host, counter)
 
-        return self.create_http_task(request, _callback, **kwargs)
+        return pywf.create_timer_task(0, _enter)
+
+    @profiled("callback")
+    def _invoke(self, do, task, request, response):
+        try:
+            return do(task, request, response)
+        except Exception as e:
+            logger.error(f"unexpected exception from {do.__module__}.{do.__name__} {e}")
+
+    def _dispatch(self, executor, series, do, request, response):
+        holder = {}
+
+        def _done(t):
+            if self.canceled():
+                return
+            self._schedule(pywf.series_of(t), holder.get("results", None))
+
+        if executor == CALLBACK_COMPUTE:
+
+            def _run():
+                holder["results"] = self._invoke(do, None, request, response)
+
+            t = pywf.create_go_task(_run)
+            t.set_callback(_done)
+            series.push_front(t)
+            return
+
+        if isinstance(executor, ProcessPoolExecutor):
+            args = (call_packed, do, pack_request(request), pack_response(response))
+        else:
+            args = (self._invoke, do, None, request, response)
+
+        # the series waits on a counter, no Workflow thread waits on the future
+        counter = pywf.create_counter_task(1, _done)
+
+        def _finished(future):
+            try:
+                holder["results"] = future.result()
+            except Exception as e:
+                logger.error(
+                    f"unexpected exception from {do.__module__}.{do.__name__} {e}"
+                )
+            counter.count()
+
+        series.push_front(counter)
+        try:
+            future = executor.submit(*args)
+        except RuntimeError as e:
+            # executor shut down, let the series go on
+            logger.error(f"can not submit {do.__module__}.{do.__name__} {e}")
+            counter.count()
+            return
+        future.add_done_callback(_finished)
+
+    def _task(self, t, **kwargs):
+        if isinstance(t, str):
+            return self.get(t, **kwargs)
+        elif isinstance(t, PreparedRequest):
+            return self.send(t, **kwargs)  # send without session param
+        elif isinstance(t, Request):
+            return self.send(t, **kwargs)
+        elif isinstance(t, pywf.SubTask):
+            return t
+        elif isinstance(t, Batch):
+            return self._fan_out(t)
+        logger.warning(f"not supported type {type(t)}")
+
+    def _fan_out(self, batch) -> pywf.SubTask:
+        """Run the requests of a batch with at most concurrency series.
+
+        Each series pulls the next request when its previous one is done, so
+        requests are created right before they are sent.
+        """
+        items = deque(enumerate(batch.requests))
+        results = [None] * len(items) if batch.callback is not None else None
+        lock = threading.Lock()
+
+        def _collect(i, do):
+            def _callback(task, request, response):
+                results[i] = (request, response)
+                if do is not None:
+                    return do(task, request, response)
+
+            return _callback
+
+        def _pull(t):
+            if self.canceled():
+                return
+            with lock:
+                if not items:
+                    return
+                i, item = items.popleft()
+            kwargs = {}
+            if results is not None and not isinstance(item, pywf.SubTask):
+                kwargs["callback"] = _collect(i, self.callback)
+                kwargs["errback"] = _collect(i, self.errback or self.callback)
+            series = pywf.series_of(t)
+            series.push_front(pywf.create_timer_task(0, _pull))
+            task = self._task(item, **kwargs)
+            if task is not None:
+                series.push_front(task)
+
+        def _done(p):
+            if batch.callback is None or self.canceled():
+                return
+            try:
+                r = batch.callback(results)
+            except Exception as e:
+                logger.error(
+                    f"unexpected exception from {batch.callback.__module__}.{batch.callback.__name__} {e}"
+                )
+                return
+            self._schedule(pywf.series_of(p), r)
+
+        concurrency = batch.concurrency or self.fanout_concurrency or len(items)
+        parallel = pywf.create_parallel_work(_done)
+        for _ in range(min(concurrency, len(items))):
+            parallel.add_series(
+                pywf.create_series_work(pywf.create_timer_task(0, _pull), None)
+            )
+        return parallel
+
+    def _schedule(self, series, results):
+        def _tasks(s):
+            if isinstance(s, list):
+                r = [self._task(t) for t in s]
+            else:
+                r = [self._task(s)]
+            return [t for t in r if t is not None]
+
+        if results is None:
+            return
+        pre, post = [], []
+        if isinstance(results, tuple):
+            l = len(results)
+            if l >= 1:
+                pre = _tasks(results[0])
+            if l >= 2:
+                post = _tasks(results[1])
+        else:
+            pre = _tasks(results)
+        list(map(series.push_front, pre[::-1]))
+        list(map(series.push_back, post))
 
     def create_http_task(self, request: PreparedRequest, cb, **kwargs) -> pywf.HttpTask:
+        self.stats.inc("requests")
+        # checked before a server is selected, which must be released
+        timeout = kwargs.get("timeout", self.timeout)
+        if timeout:
+            if isinstance(timeout, tuple):
+                pass
+            elif isinstance(timeout, int):
+                timeout = (timeout, timeout)
+            else:
+                raise ValueError("timeout must be None tuple or int")
         proxies = kwargs.get("proxies", self.proxies)
         proxy = select_proxy(request.url, proxies)
         request_url_parsed = None
+        server = None
         if not proxy:
-            task = pywf.create_http_task(request.url, 0, 0, cb)
+            url = request.url
+            if self.upstreams:
+                request_url_parsed = urlparse(request.url)
+                upstream = self.upstreams.get(request_url_parsed.hostname, None)
+                if self.resolved_hosts:
+                    if request_url_parsed.hostname in self.resolved_hosts:
+                        self.stats.inc("resolve_hits")
+                    else:
+                        self.stats.inc("resolve_misses")
+                # send fails the request before, this is for direct calls
+                error = self._resolved_port_error(request_url_parsed)
+                if error is not None:
+                    raise error
+                # other policies are resolved by Workflow with the url host
+                if upstream is not None and upstream.policy == LEAST_LOADED:
+                    server = upstream.select()
+                    url = request_url_parsed._replace(netloc=server.address).geturl()
+                    cb = self._upstream_callback(upstream, server, cb)
+            task = pywf.create_http_task(url, 0, 0, cb)
         else:
             request_url_parsed = urlparse(request.url)
             request_scheme = request_url_parsed.scheme.lower()
@@ -450,14 +1405,7 @@ class Session(object):
             # should remove auth from url?
             # request.url = urldefragauth(request.url)
 
-        timeout = kwargs.get("timeout", self.timeout)
         if timeout:
-            if isinstance(timeout, tuple):
-                pass
-            elif isinstance(timeout, int):
-                timeout = (timeout, timeout)
-            else:
-                raise ValueError("timeout must be None tuple or int")
             if timeout[0] >= 0:
                 task.set_send_timeout(timeout[0] * MILLION)
             if timeout[1] >= 0:
@@ -469,7 +1417,11 @@ class Session(object):
         req = task.get_req()
         req.set_method(request.method)
         if request.body:
-            req.append_body(request.body)
+            if isinstance(request.body, (bytes, str)):
+                req.append_body(request.body)
+            else:  # streamed body, FileBody or MultipartBody
+                for chunk in request.body:
+                    req.append_body(chunk)
         req.set_http_version(kwargs.get("version", self.version))
         for k, v in request.headers.items():
             req.set_header_pair(k, v)
@@ -485,8 +1437,25 @@ class Session(object):
                     "Proxy-Authorization", _basic_auth_str(username, password)
                 )
             req.set_header_pair("Host", request_url_parsed.netloc)
+        elif server is not None and "Host" not in request.headers:
+            req.set_header_pair("Host", request_url_parsed.netloc)
         return task
 
+    def _upstream_callback(self, upstream, server, cb):
+        def _callback(task):
+            ok = task.get_state() == 0
+            if ok:
+                try:
+                    ok = int(task.get_resp().get_status_code()) < 500
+                except ValueError:
+                    ok = False
+            upstream.done(server, ok)
+            if not ok:
+                self.stats.inc("upstream_failures")
+            cb(task)
+
+        return _callback
+
     def __enter__(self):
         return self
 
@@ -494,7 +1463,12 @@ class Session(object):
         self.close()
 
     def close(self):
-        pass
+        if hasattr(self.cookies, "flush"):
+            self.cookies.flush()
+        # resolved upstreams are process wide, later sessions resolve again
+        for host in self.resolved_hosts:
+            self.upstreams.pop(host).unregister()
+        self.resolved_hosts.clear()
 
     def get(self, url, params=None, **kwargs):
         kwargs.pop("method", None)
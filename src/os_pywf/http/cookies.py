@@ -0,0 +1,193 @@
+import json
+import sqlite3
+import threading
+import time
+from http.cookiejar import Cookie
+from urllib.parse import urlparse
+
+from requests.cookies import RequestsCookieJar
+
+DEFAULT_BATCH_SIZE = 100
+# seconds, pending changes are written when the next change comes after it
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+_COOKIE_FIELDS = (
+    "version",
+    "name",
+    "value",
+    "port",
+    "port_specified",
+    "domain",
+    "domain_specified",
+    "domain_initial_dot",
+    "path",
+    "path_specified",
+    "secure",
+    "expires",
+    "discard",
+    "comment",
+    "comment_url",
+    "rfc2109",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cookies (
+    domain TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (domain, path, name)
+)
+"""
+
+
+def cookie_to_json(cookie):
+    o = dict([(k, getattr(cookie, k)) for k in _COOKIE_FIELDS])
+    o["rest"] = cookie._rest
+    return json.dumps(o)
+
+
+def cookie_from_json(s):
+    return Cookie(**json.loads(s))
+
+
+def domain_candidates(host):
+    """Cookie domains which may match the host."""
+    host = host.lower()
+    if "." not in host:
+        host = f"{host}.local"
+    parts = host.split(".")
+    domains = []
+    for i in range(len(parts)):
+        d = ".".join(parts[i:])
+        domains.append(d)
+        domains.append(f".{d}")
+    return domains
+
+
+class SqliteCookieJar(RequestsCookieJar):
+    """Cookie jar persisted in a sqlite database.
+
+    Changes are written in batches, cookies of a domain are loaded when a
+    request to it is prepared (see load_url). The database is in WAL mode, so
+    several processes can share it, cookies of a domain are loaded once by
+    each process.
+    """
+
+    def __init__(
+        self,
+        filename,
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        policy=None,
+    ):
+        super(SqliteCookieJar, self).__init__(policy)
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._db = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(_SCHEMA)
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self._loaded = set()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def load_url(self, url):
+        host = urlparse(url).hostname
+        if host:
+            self.load_domains(domain_candidates(host))
+
+    def load_domains(self, domains):
+        # the jar lock is taken first, as by add_cookie_header, a domain is
+        # marked loaded only after its cookies are in the jar
+        with self._cookies_lock:
+            domains = [d for d in domains if d not in self._loaded]
+            if not domains:
+                return
+            marks = ",".join(["?"] * len(domains))
+            with self._db_lock:
+                rows = self._db.execute(
+                    f"SELECT data FROM cookies WHERE domain IN ({marks})", domains
+                ).fetchall()
+            now = time.time()
+            for (data,) in rows:
+                cookie = cookie_from_json(data)
+                if cookie.is_expired(now):
+                    continue
+                # not a change, do not write it back
+                super(SqliteCookieJar, self).set_cookie(cookie)
+            self._loaded.update(domains)
+
+    def load_all(self):
+        """Load cookies of all domains, e.g. to save the whole database."""
+        self.flush()
+        with self._db_lock:
+            rows = self._db.execute("SELECT DISTINCT domain FROM cookies").fetchall()
+        self.load_domains([domain for (domain,) in rows])
+
+    def _cookies_for_request(self, request):
+        self.load_url(request.get_full_url())
+        return super(SqliteCookieJar, self)._cookies_for_request(request)
+
+    def set_cookie(self, cookie, *args, **kwargs):
+        super(SqliteCookieJar, self).set_cookie(cookie, *args, **kwargs)
+        self._change((cookie.domain, cookie.path, cookie.name), cookie)
+
+    def clear(self, domain=None, path=None, name=None):
+        super(SqliteCookieJar, self).clear(domain, path, name)
+        if name is not None:
+            self._change((domain, path, name), None)
+            return
+        where, args = [], []
+        for k, v in (("domain", domain), ("path", path)):
+            if v is not None:
+                where.append(f"{k} = ?")
+                args.append(v)
+        sql = "DELETE FROM cookies"
+        if where:
+            sql = f"{sql} WHERE {' AND '.join(where)}"
+        self.flush()
+        with self._db_lock:
+            self._db.execute(sql, args)
+            self._db.commit()
+
+    def _change(self, key, cookie):
+        with self._db_lock:
+            self._pending[key] = cookie
+            if (
+                len(self._pending) < self.batch_size
+                and time.monotonic() - self._last_flush < self.flush_interval
+            ):
+                return
+            self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        self._last_flush = time.monotonic()
+        if not pending:
+            return
+        # session cookies are kept too, same as save_cookiejar
+        upserts = [
+            (k[0], k[1], k[2], cookie_to_json(c))
+            for k, c in pending.items()
+            if c is not None
+        ]
+        deletes = [k for k, c in pending.items() if c is None]
+        self._db.executemany(
+            "INSERT OR REPLACE INTO cookies VALUES (?, ?, ?, ?)", upserts
+        )
+        self._db.executemany(
+            "DELETE FROM cookies WHERE domain = ? AND path = ? AND name = ?", deletes
+        )
+        self._db.commit()
+
+    def flush(self):
+        with self._db_lock:
+            self._flush()
+
+    def close(self):
+        with self._db_lock:
+            self._flush()
+            self._db.close()
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from requests.structures import CaseInsensitiveDict
+
+
+class ResponseHeaders(CaseInsensitiveDict):
+    """Response headers keep every value of repeated names.
+
+    Header pairs are kept as received, the case-insensitive dict of
+    requests (values of repeated names joined with ", ") is built only when
+    it is iterated. Single lookups scan the pairs. ``get_all`` returns every
+    value of a name, it is also what http.cookiejar reads Set-Cookie with.
+    """
+
+    def __init__(self, pairs=None, **kwargs):
+        if pairs is None:
+            pairs = []
+        elif isinstance(pairs, Mapping):
+            pairs = list(pairs.items())
+        self._pairs = pairs
+        self._materialized = None
+        if kwargs:
+            self.update(kwargs)
+
+    @property
+    def _store(self):
+        if self._materialized is None:
+            store = OrderedDict()
+            for k, v in self._pairs:
+                lk = k.lower()
+                if lk in store:
+                    store[lk] = (store[lk][0], f"{store[lk][1]}, {v}")
+                else:
+                    store[lk] = (k, v)
+            self._materialized = store
+        return self._materialized
+
+    @_store.setter
+    def _store(self, value):
+        self._materialized = value
+
+    def get_all(self, key, failobj=None):
+        lk = key.lower()
+        values = [v for k, v in self._pairs if k.lower() == lk]
+        return values if values else failobj
+
+    def multi_items(self):
+        return list(self._pairs)
+
+    def __getitem__(self, key):
+        if self._materialized is not None:
+            return self._materialized[key.lower()][1]
+        values = self.get_all(key)
+        if values is None:
+            raise KeyError(key)
+        return ", ".join(values)
+
+    def __contains__(self, key):
+        if self._materialized is not None:
+            return key.lower() in self._materialized
+        return self.get_all(key) is not None
+
+    def __setitem__(self, key, value):
+        lk = key.lower()
+        self._pairs = [(k, v) for k, v in self._pairs if k.lower() != lk]
+        self._pairs.append((key, value))
+        if self._materialized is not None:
+            self._materialized[lk] = (key, value)
+
+    def __delitem__(self, key):
+        lk = key.lower()
+        if lk not in self:
+            raise KeyError(key)
+        self._pairs = [(k, v) for k, v in self._pairs if k.lower() != lk]
+        if self._materialized is not None:
+            del self._materialized[lk]
+
+    def add(self, key, value):
+        """Add a value without replacing the existing ones."""
+        self._pairs.append((key, value))
+        self._materialized = None
+
+    def copy(self):
+        return ResponseHeaders(list(self._pairs))
+
+    def __getstate__(self):
+        return {"_pairs": list(self._pairs), "_materialized": None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+def multi_items(headers):
+    """Header pairs with every value of repeated names when available."""
+    if isinstance(headers, ResponseHeaders):
+        return headers.multi_items()
+    return list(headers.items())
@@ -0,0 +1,79 @@
+import math
+import threading
+from collections import deque
+
+# methods safe to send twice
+HEDGEABLE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+DEFAULT_HEDGE_RATIO = 0.1
+DEFAULT_WINDOW = 1024
+# percentile delay is not used until this number of latencies observed
+MIN_SAMPLES = 20
+# the percentile is recomputed every this number of latencies observed
+RECOMPUTE_EVERY = 64
+
+
+def delay_from_string(s):
+    """Parse seconds like ``0.05`` or a percentile like ``p95``.
+
+    Return (seconds, None) or (None, percentile).
+    """
+    if isinstance(s, (int, float)):
+        delay, percentile = float(s), None
+    elif s.lower().startswith("p"):
+        delay, percentile = None, float(s[1:])
+        if not 0 < percentile < 100:
+            raise ValueError(f"invalid hedge delay {s}")
+    else:
+        delay, percentile = float(s), None
+    if delay is not None and delay < 0:
+        raise ValueError(f"invalid hedge delay {s}")
+    return delay, percentile
+
+
+class Hedger(object):
+    """Decide when to send a hedged request and whether there is budget.
+
+    The delay is fixed or a percentile of recent latencies. At most ratio of
+    the requests are hedged.
+    """
+
+    def __init__(self, delay, ratio=DEFAULT_HEDGE_RATIO, window=DEFAULT_WINDOW):
+        self.fixed, self.percentile = delay_from_string(delay)
+        self.ratio = ratio
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self._observed = 0
+        self._delay = None
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.requests += 1
+
+    def allow(self):
+        with self._lock:
+            if self.hedged + 1 > self.requests * self.ratio:
+                return False
+            self.hedged += 1
+            return True
+
+    def observe(self, seconds):
+        if self.percentile is None:
+            return
+        with self._lock:
+            self.latencies.append(seconds)
+            self._observed += 1
+            if self._observed >= MIN_SAMPLES and (
+                self._delay is None or self._observed % RECOMPUTE_EVERY == 0
+            ):
+                latencies = sorted(self.latencies)
+                i = math.ceil(len(latencies) * self.percentile / 100) - 1
+                self._delay = latencies[max(i, 0)]
+
+    def delay(self):
+        """Seconds to wait before hedging, None means do not hedge."""
+        if self.percentile is None:
+            return self.fixed
+        return self._delay
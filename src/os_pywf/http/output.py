@@ -0,0 +1,353 @@
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import os_pywf
+from os_pywf.exceptions import Failure
+from os_pywf.http.headers import multi_items
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 1024
+DEFAULT_BATCH_SIZE = 64
+
+_STOP = object()
+
+
+def record_from_response(task, request, response, raw_body=False):
+    """Snapshot of a transaction for the output writer.
+
+    It only copies references and is cheap enough for handler threads, all the
+    serialization is done by the writer thread.
+    """
+    record = {
+        "time": time.time(),
+        "method": request.method,
+        "url": request.url,
+        "request_headers": list(request.headers.items()),
+        "request_body": request.body,
+    }
+    if isinstance(response, Failure):
+        record["error"] = str(response)
+        return record
+    record.update(
+        {
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": multi_items(response.headers),
+            "elapsed": response.elapsed.total_seconds(),
+            "body": response.content,
+        }
+    )
+    if raw_body:
+        resp = task.get_resp()
+        record["http_version"] = resp.get_http_version()
+        record["raw_body"] = resp.get_body()
+    return record
+
+
+class BodySink(object):
+    """Write response bodies to files of a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.count = 0
+
+    def write(self, records):
+        for record in records:
+            body = record.get("body", None)
+            if body is None:
+                continue
+            self.count += 1
+            digest = hashlib.sha1(record["url"].encode("utf8")).hexdigest()
+            filename = f"{self.count:08d}-{digest[:16]}"
+            with open(os.path.join(self.directory, filename), "wb") as f:
+                f.write(body)
+            record["file"] = filename
+
+    def close(self):
+        pass
+
+
+class JsonlSink(object):
+    """Write metadata of transactions as JSON lines."""
+
+    fields = ("time", "method", "url", "status", "reason", "headers", "elapsed")
+
+    def __init__(self, filename):
+        self.file = open(filename, "a", encoding="utf8")
+
+    def write(self, records):
+        lines = []
+        for record in records:
+            o = dict([(k, record[k]) for k in self.fields if k in record])
+            for k in ("file", "error"):
+                if k in record:
+                    o[k] = record[k]
+            lines.append(json.dumps(o, ensure_ascii=False))
+        lines.append("")
+        self.file.write("\n".join(lines))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _warc_date(t):
+    return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _http_block(start_line, headers, body):
+    lines = [start_line]
+    lines.extend([f"{k}: {v}" for k, v in headers])
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("utf8")
+    if not body:
+        return head
+    if isinstance(body, str):
+        body = body.encode("utf8")
+    elif not isinstance(body, bytes):
+        body = bytes(body)  # streamed body
+    return head + body
+
+
+class WarcSink(object):
+    """Write request and response records to a WARC/1.0 file.
+
+    Each record is a gzip member when the filename ends with ``.gz``.
+    """
+
+    def __init__(self, filename):
+        self.compress = filename.endswith(".gz")
+        self.file = open(filename, "ab")
+        info = [
+            f"software: os-pywf/{os_pywf.__version__}",
+            "format: WARC File Format 1.0",
+        ]
+        self._write_record(
+            "warcinfo",
+            ("\r\n".join(info) + "\r\n").encode("utf8"),
+            "application/warc-fields",
+            time.time(),
+        )
+
+    def _write_record(self, warc_type, block, content_type, t, headers=None):
+        record_id = f"<urn:uuid:{uuid.uuid4()}>"
+        lines = [
+            "WARC/1.0",
+            f"WARC-Type: {warc_type}",
+            f"WARC-Record-ID: {record_id}",
+            f"WARC-Date: {_warc_date(t)}",
+        ]
+        if headers:
+            lines.extend([f"{k}: {v}" for k, v in headers])
+        lines.append(f"Content-Type: {content_type}")
+        lines.append(f"Content-Length: {len(block)}")
+        data = ("\r\n".join(lines) + "\r\n\r\n").encode("utf8") + block + b"\r\n\r\n"
+        if self.compress:
+            data = gzip.compress(data)
+        self.file.write(data)
+        return record_id
+
+    def write(self, records):
+        for record in records:
+            if "raw_body" not in record:
+                continue
+            t = record["time"]
+            target = [("WARC-Target-URI", record["url"])]
+            version = record["http_version"]
+            response_id = self._write_record(
+                "response",
+                _http_block(
+                    f"{version} {record['status']} {record['reason']}",
+                    record["headers"],
+                    record["raw_body"],
+                ),
+                "application/http; msgtype=response",
+                t,
+                target,
+            )
+            parsed = urlsplit(record["url"])
+            uri = parsed.path or "/"
+            if parsed.query:
+                uri = f"{uri}?{parsed.query}"
+            self._write_record(
+                "request",
+                _http_block(
+                    f"{record['method']} {uri} {version}",
+                    record["request_headers"],
+                    record["request_body"],
+                ),
+                "application/http; msgtype=request",
+                t,
+                target + [("WARC-Concurrent-To", response_id)],
+            )
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _har_headers(headers):
+    return [{"name": k, "value": v} for k, v in headers]
+
+
+def _har_content(body, mime_type):
+    content = {"size": len(body) if body else 0, "mimeType": mime_type}
+    if not body:
+        return content
+    if isinstance(body, str):
+        content["text"] = body
+        return content
+    try:
+        content["text"] = body.decode("utf8")
+    except UnicodeDecodeError:
+        content["text"] = base64.b64encode(body).decode("ascii")
+        content["encoding"] = "base64"
+    return content
+
+
+def har_entry(record):
+    version = record.get("http_version", "HTTP/1.1")
+    request_headers = record["request_headers"]
+    request_body = record["request_body"]
+    if request_body is not None and not isinstance(request_body, (bytes, str)):
+        request_body = bytes(request_body)  # streamed body
+    request = {
+        "method": record["method"],
+        "url": record["url"],
+        "httpVersion": version,
+        "headers": _har_headers(request_headers),
+        "queryString": [],
+        "cookies": [],
+        "headersSize": -1,
+        "bodySize": len(request_body) if request_body else 0,
+    }
+    if request_body:
+        mime_type = dict([(k.lower(), v) for k, v in request_headers]).get(
+            "content-type", ""
+        )
+        post = _har_content(request_body, mime_type)
+        request["postData"] = {"mimeType": mime_type, "text": post.get("text", "")}
+    elapsed = record.get("elapsed", 0) * 1000
+    entry = {
+        "startedDateTime": datetime.fromtimestamp(
+            record["time"] - elapsed / 1000, timezone.utc
+        ).isoformat(),
+        "time": elapsed,
+        "request": request,
+        "cache": {},
+        "timings": {"send": 0, "wait": elapsed, "receive": 0},
+    }
+    if "error" in record:
+        entry["response"] = {
+            "status": 0,
+            "statusText": "",
+            "httpVersion": version,
+            "headers": [],
+            "cookies": [],
+            "content": {"size": 0, "mimeType": ""},
+            "redirectURL": "",
+            "headersSize": -1,
+            "bodySize": -1,
+            "_error": record["error"],
+        }
+        return entry
+    headers = record["headers"]
+    lower = dict([(k.lower(), v) for k, v in headers])
+    entry["response"] = {
+        "status": record["status"],
+        "statusText": record["reason"] or "",
+        "httpVersion": version,
+        "headers": _har_headers(headers),
+        "cookies": [],
+        "content": _har_content(record["body"], lower.get("content-type", "")),
+        "redirectURL": lower.get("location", ""),
+        "headersSize": -1,
+        "bodySize": len(record["body"]) if record["body"] else 0,
+    }
+    return entry
+
+
+class HarSink(object):
+    """Write transactions to a HAR 1.2 file, entries are written as they come."""
+
+    def __init__(self, filename):
+        self.file = open(filename, "w", encoding="utf8")
+        creator = {"name": "os-pywf", "version": os_pywf.__version__}
+        log = json.dumps({"version": "1.2", "creator": creator})
+        self.file.write(f'{{"log": {log[:-1]}, "entries": [\n')
+        self.count = 0
+
+    def write(self, records):
+        lines = []
+        for record in records:
+            line = json.dumps(har_entry(record), ensure_ascii=False)
+            lines.append(line if self.count == 0 else f",{line}")
+            self.count += 1
+        lines.append("")
+        self.file.write("\n".join(lines))
+        self.file.flush()
+
+    def close(self):
+        self.file.write("]}}\n")
+        self.file.close()
+
+
+class OutputWriter(threading.Thread):
+    """Feed records to sinks from a dedicated thread.
+
+    Records are put into a bounded queue, the writer thread takes them in
+    batches so file I/O is not done on the pywf handler threads. When the
+    queue is full, put blocks until the writer catches up.
+    """
+
+    def __init__(
+        self, sinks, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE
+    ):
+        super(OutputWriter, self).__init__(name="os-pywf-output", daemon=True)
+        self.sinks = sinks
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.raw_body = any([isinstance(s, WarcSink) for s in sinks])
+
+    def record(self, task, request, response):
+        self.queue.put(
+            record_from_response(task, request, response, raw_body=self.raw_body)
+        )
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stop = True
+                batch = [r for r in batch if r is not _STOP]
+            if not batch:
+                continue
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                except Exception as e:
+                    logger.error(f"output error {sink.__class__.__name__} {e}")
+
+    def close(self):
+        if self.is_alive():
+            self.queue.put(_STOP)
+            self.join()
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,51 @@
+import heapq
+import itertools
+import threading
+import time
+
+# priority points a waiting request gains per second
+DEFAULT_AGING = 1.0
+
+
+class PriorityDispatcher(object):
+    """Limit in-flight requests and hand free slots to the highest priority.
+
+    Higher priority goes first. Waiting requests gain aging points per
+    second, the effective priority is priority + aging * waited, so the
+    order of two waiting requests never changes and a heap keyed by
+    priority - aging * enqueue_time is enough.
+    """
+
+    def __init__(self, max_inflight, aging=DEFAULT_AGING):
+        self.max_inflight = max_inflight
+        self.aging = aging
+        self.inflight = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority, create_counter):
+        """Take a slot now and return None, or return a counter task created
+        by create_counter which is counted when a slot is handed over.
+        """
+        with self._lock:
+            if self.inflight < self.max_inflight and not self._heap:
+                self.inflight += 1
+                return None
+            counter = create_counter()
+            key = self.aging * time.monotonic() - priority
+            heapq.heappush(self._heap, (key, next(self._seq), counter))
+            return counter
+
+    def release(self):
+        with self._lock:
+            if not self._heap:
+                self.inflight -= 1
+                return
+            # the slot is handed over, inflight does not change
+            _, _, counter = heapq.heappop(self._heap)
+        counter.count()
+
+    def waiting(self):
+        with self._lock:
+            return len(self._heap)
@@ -0,0 +1,166 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+import pywf
+
+from os_pywf.utils import MILLION
+
+# max seconds the ticker sleeps, so waiting requests are released soon after
+# the session is canceled
+MAX_TICK = 1 / 3
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    def delay(self, now):
+        """Seconds until a token is available, 0 when available now."""
+        if now > self.last:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+
+class RateLimiter(object):
+    """Global and per host token buckets.
+
+    Requests which can not get tokens wait on a counter task. One pywf timer
+    task at a time wakes up when the next token is available and counts the
+    released counters, no matter how many requests are waiting. Hosts with
+    waiting requests are kept in a heap by the time their next token is due,
+    a tick only looks at the hosts which are due.
+    """
+
+    def __init__(self, rate=None, rate_per_host=None, burst=1, cancel=None):
+        self.rate = rate
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.cancel = cancel
+        self._global = TokenBucket(rate, burst) if rate else None
+        self._hosts = {}
+        self._waiting = {}
+        # (due, seq, host) of each host in _waiting
+        self._due = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._ticking = False
+
+    def _bucket(self, host):
+        if not self.rate_per_host:
+            return None
+        bucket = self._hosts.get(host, None)
+        if bucket is None:
+            bucket = self._hosts[host] = TokenBucket(self.rate_per_host, self.burst)
+        return bucket
+
+    def _delay(self, host, now):
+        delay = 0
+        if self._global is not None:
+            delay = self._global.delay(now)
+        bucket = self._bucket(host)
+        if bucket is not None:
+            delay = max(delay, bucket.delay(now))
+        return delay
+
+    def _consume(self, host):
+        if self._global is not None:
+            self._global.consume()
+        bucket = self._bucket(host)
+        if bucket is not None:
+            bucket.consume()
+
+    def acquire(self, host):
+        """Take tokens if available now and nobody of the host is waiting."""
+        if not self.rate_per_host:
+            host = ""
+        with self._lock:
+            if host in self._waiting or self._delay(host, time.monotonic()) > 0:
+                return False
+            self._consume(host)
+            return True
+
+    def wait(self, host, counter):
+        """Count the counter task when tokens are available."""
+        if not self.rate_per_host:
+            host = ""
+        with self._lock:
+            q = self._waiting.get(host, None)
+            if q is None:
+                q = self._waiting[host] = deque()
+                now = time.monotonic()
+                self._schedule(host, now + self._delay(host, now))
+            q.append(counter)
+            if not self._ticking:
+                self._ticking = True
+                self._start_tick(0)
+
+    def _schedule(self, host, due):
+        heapq.heappush(self._due, (due, next(self._seq), host))
+
+    def _start_tick(self, delay):
+        t = pywf.create_timer_task(int(delay * MILLION), self._tick)
+        t.start()
+
+    def _tick(self, task):
+        released = []
+        with self._lock:
+            canceled = self.cancel is not None and self.cancel.is_set()
+            now = time.monotonic()
+            next_delay = MAX_TICK
+            while self._due:
+                due, _, host = self._due[0]
+                if not canceled:
+                    if due > now:
+                        next_delay = min(next_delay, due - now)
+                        break
+                    if self._global is not None:
+                        delay = self._global.delay(now)
+                        if delay > 0:
+                            next_delay = min(next_delay, delay)
+                            break
+                    bucket = self._bucket(host)
+                    delay = 0 if bucket is None else bucket.delay(now)
+                    if delay > 0:
+                        heapq.heapreplace(
+                            self._due, (now + delay, next(self._seq), host)
+                        )
+                        continue
+                    self._consume(host)
+                q = self._waiting[host]
+                released.append(q.popleft())
+                if q:
+                    # behind the other due hosts, hosts share the global
+                    # bucket fairly
+                    heapq.heapreplace(
+                        self._due,
+                        (
+                            now + (0 if canceled else self._delay(host, now)),
+                            next(self._seq),
+                            host,
+                        ),
+                    )
+                else:
+                    heapq.heappop(self._due)
+                    self._waiting.pop(host)
+            if self._waiting:
+                self._start_tick(next_delay)
+            else:
+                self._ticking = False
+        for counter in released:
+            counter.count()
+
+    def waiting(self):
+        with self._lock:
+            return sum([len(q) for q in self._waiting.values()])
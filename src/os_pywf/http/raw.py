@@ -0,0 +1,128 @@
+import json
+
+from requests.models import REDIRECT_STATI
+from requests.utils import get_encoding_from_headers
+
+from os_pywf.exceptions import Failure
+from os_pywf.http.headers import ResponseHeaders
+
+RESPONSE_RAW = "raw"
+
+
+class RawResponse(object):
+    """Lightweight response, a view over the pywf HttpResponse.
+
+    Status, reason, headers and body are read from the pywf response when
+    first accessed. The pywf response is only valid in the callback of its
+    task, the session releases it after the callback returns, load() copies
+    the fields not read yet so the response can be kept. The body is the
+    body as received, it is not decompressed.
+    """
+
+    __slots__ = (
+        "_resp",
+        "_status_code",
+        "_reason",
+        "_headers",
+        "_content",
+        "url",
+        "request",
+        "elapsed",
+        "history",
+    )
+
+    def __init__(self, resp, request):
+        self._resp = resp
+        self._status_code = None
+        self._reason = None
+        self._headers = None
+        self._content = None
+        self.url = request.url
+        self.request = request
+        self.elapsed = None
+        self.history = []
+
+    def _pywf_resp(self):
+        if self._resp is None:
+            raise RuntimeError(
+                "response is released, read it in callback or call load() before"
+            )
+        return self._resp
+
+    @property
+    def status_code(self):
+        if self._status_code is None:
+            self._status_code = int(self._pywf_resp().get_status_code())
+        return self._status_code
+
+    @property
+    def reason(self):
+        if self._reason is None:
+            self._reason = self._pywf_resp().get_reason_phrase()
+        return self._reason
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = ResponseHeaders(self._pywf_resp().get_headers())
+        return self._headers
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self._pywf_resp().get_body()
+        return self._content
+
+    @property
+    def encoding(self):
+        return get_encoding_from_headers(self.headers)
+
+    @property
+    def text(self):
+        try:
+            return str(self.content, self.encoding or "utf-8", errors="replace")
+        except LookupError:  # unknown charset
+            return str(self.content, "utf-8", errors="replace")
+
+    def json(self, **kwargs):
+        return json.loads(self.content, **kwargs)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def is_redirect(self):
+        return "location" in self.headers and self.status_code in REDIRECT_STATI
+
+    def load(self):
+        if self._resp is not None:
+            self.status_code, self.reason, self.headers, self.content
+            self._resp = None
+        return self
+
+    def release(self):
+        self._resp = None
+
+    def __repr__(self):
+        if self._resp is None and self._status_code is None:
+            return "<RawResponse>"
+        return f"<RawResponse [{self.status_code}]>"
+
+
+def _raw_responses(response):
+    if isinstance(response, RawResponse):
+        yield response
+    elif isinstance(response, Failure) and isinstance(response.value, RawResponse):
+        yield response.value
+
+
+def load_raw_response(response):
+    """Load the raw response (or value of failure) to keep it after callback."""
+    for r in _raw_responses(response):
+        r.load()
+
+
+def release_raw_response(response):
+    for r in _raw_responses(response):
+        r.release()
@@ -0,0 +1,287 @@
+import base64
+import json
+import re
+import threading
+import time
+from datetime import datetime
+
+import pywf
+
+from os_pywf.utils import MILLION
+
+READ_SIZE = 1 << 16
+
+# headers computed again when the request is sent
+SKIP_HEADERS = ("content-length",)
+
+_ENTRIES = re.compile(r'"entries"\s*:\s*\[')
+# a HAR is an object with the log key, a JSON lines spec has no log
+_HAR_START = re.compile(r'\s*\{\s*"log"\s*:')
+
+# raised by a malformed spec: bad JSON, missing or mistyped keys, bad base64
+SPEC_ERRORS = (ValueError, KeyError, TypeError, AttributeError)
+
+
+def _noop(task):
+    pass
+
+
+class RequestSpec(object):
+    __slots__ = ("method", "url", "headers", "body", "time")
+
+    def __init__(self, method, url, headers=None, body=None, time=None):
+        self.method = method
+        self.url = url
+        self.headers = headers or []
+        self.body = body
+        self.time = time
+
+
+def _headers(pairs):
+    return [
+        (k, v)
+        for k, v in pairs
+        # HTTP/2 pseudo headers
+        if not k.startswith(":") and k.lower() not in SKIP_HEADERS
+    ]
+
+
+def parse_time(s):
+    """Seconds since epoch of an ISO 8601 time like HAR startedDateTime."""
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    return datetime.fromisoformat(s).timestamp()
+
+
+def spec_from_har_entry(entry):
+    request = entry["request"]
+    body = None
+    post = request.get("postData", None)
+    if post and post.get("text", None) is not None:
+        body = post["text"].encode("utf8")
+    t = entry.get("startedDateTime", None)
+    return RequestSpec(
+        request["method"],
+        request["url"],
+        _headers([(h["name"], h["value"]) for h in request.get("headers", [])]),
+        body,
+        parse_time(t) if t else None,
+    )
+
+
+def spec_from_json(o):
+    """Build a spec from a JSON object.
+
+    Keys are method (default GET), url, headers (object or list of pairs),
+    body (text) or body_base64, time (seconds or ISO 8601 time).
+    """
+    headers = o.get("headers", None) or []
+    if isinstance(headers, dict):
+        headers = list(headers.items())
+    body = o.get("body", None)
+    if body is not None:
+        body = body.encode("utf8")
+    elif o.get("body_base64", None) is not None:
+        body = base64.b64decode(o["body_base64"])
+    t = o.get("time", None)
+    if isinstance(t, str):
+        t = parse_time(t)
+    return RequestSpec(
+        o.get("method", "GET").upper(), o["url"], _headers(headers), body, t
+    )
+
+
+def _malformed(on_error, where, e):
+    if on_error is None:
+        raise e
+    on_error(where, e)
+
+
+def iter_har(f, on_error=None):
+    """Yield specs of entries of a HAR file without loading it whole.
+
+    A malformed entry is passed to on_error(where, exception) and skipped,
+    it is raised when on_error is None.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    eof = False
+    while True:
+        m = _ENTRIES.search(buf)
+        if m:
+            buf = buf[m.end() :]
+            break
+        if eof:
+            return
+        # keep the tail, the key may be split between reads
+        buf = buf[-32:]
+        data = f.read(READ_SIZE)
+        eof = not data
+        buf += data
+    pos = 0
+    count = 0
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            entry, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                # the rest of the file can not be split into entries
+                _malformed(on_error, f"entry {count + 1}", e)
+                return
+            data = f.read(READ_SIZE)
+            eof = not data
+            buf = buf[pos:] + data
+            pos = 0
+            continue
+        count += 1
+        pos = end
+        try:
+            spec = spec_from_har_entry(entry)
+        except SPEC_ERRORS as e:
+            _malformed(on_error, f"entry {count}", e)
+            continue
+        yield spec
+
+
+def iter_jsonl(f, on_error=None):
+    """Yield specs of lines, see iter_har for on_error."""
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            spec = spec_from_json(json.loads(line))
+        except SPEC_ERRORS as e:
+            _malformed(on_error, f"line {lineno}", e)
+            continue
+        yield spec
+
+
+class _Prefixed(object):
+    """File of data read ahead followed by the rest of f."""
+
+    def __init__(self, head, f):
+        self.head = head
+        self.f = f
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.f.read(size)
+        if size is None or size < 0:
+            data, self.head = self.head + self.f.read(), ""
+        else:
+            data, self.head = self.head[:size], self.head[size:]
+        return data
+
+    def __iter__(self):
+        if self.head:
+            head, self.head = self.head, ""
+            # complete the last line of the head
+            yield from (head + self.f.readline()).splitlines(True)
+        yield from self.f
+
+
+def iter_specs(f, filename="", on_error=None):
+    """Specs of a HAR or JSON lines file by the extension, by the content
+    when the extension is neither, e.g. stdin."""
+    if filename.endswith((".jsonl", ".ndjson")):
+        return iter_jsonl(f, on_error)
+    if filename.endswith(".har"):
+        return iter_har(f, on_error)
+    head = f.read(READ_SIZE)
+    f = _Prefixed(head, f)
+    if _HAR_START.match(head):
+        return iter_har(f, on_error)
+    return iter_jsonl(f, on_error)
+
+
+class Replayer(object):
+    """Send requests of specs through a session.
+
+    speed 1 keeps the original timing, 2 is twice as fast, 0 sends as fast as
+    possible. At most concurrency requests are in flight. Specs are pulled
+    one at a time, each request runs as its own series.
+    """
+
+    def __init__(self, session, specs, speed=1.0, concurrency=100, **kwargs):
+        self.session = session
+        self.specs = iter(specs)
+        self.speed = speed
+        self.concurrency = concurrency
+        self.kwargs = kwargs
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._waiting = None
+        self._done = None
+        self._exhausted = False
+        self._first = None
+        self._start = None
+
+    def create_task(self) -> pywf.SubTask:
+        return pywf.create_timer_task(0, self._feed)
+
+    def _delay(self, spec):
+        if self.speed <= 0 or spec.time is None:
+            return 0
+        now = time.monotonic()
+        if self._first is None:
+            self._first, self._start = spec.time, now
+        return (spec.time - self._first) / self.speed - (now - self._start)
+
+    def _feed(self, t):
+        series = pywf.series_of(t)
+        spec = None
+        if not self.session.canceled():
+            with self._lock:
+                if self.inflight >= self.concurrency:
+                    self._waiting = pywf.create_counter_task(1, _noop)
+                    series.push_front(pywf.create_timer_task(0, self._feed))
+                    series.push_front(self._waiting)
+                    return
+            spec = next(self.specs, None)
+        if spec is None:
+            with self._lock:
+                self._exhausted = True
+                if self.inflight > 0:
+                    self._done = pywf.create_counter_task(1, _noop)
+                    series.push_front(self._done)
+            return
+        delay = self._delay(spec)
+        series.push_front(pywf.create_timer_task(0, self._feed))
+        if delay > 0:
+            series.push_front(
+                pywf.create_timer_task(int(delay * MILLION), lambda _: self._send(spec))
+            )
+        else:
+            self._send(spec)
+
+    def _send(self, spec):
+        if self.session.canceled():
+            return
+        task = self.session.request(
+            spec.url,
+            method=spec.method,
+            headers=dict(spec.headers),
+            data=spec.body,
+            **self.kwargs,
+        )
+        with self._lock:
+            self.inflight += 1
+        pywf.create_series_work(task, self._finished).start()
+
+    def _finished(self, series):
+        counters = []
+        with self._lock:
+            self.inflight -= 1
+            if self._waiting is not None:
+                counters.append(self._waiting)
+                self._waiting = None
+            if self._exhausted and self.inflight == 0 and self._done is not None:
+                counters.append(self._done)
+                self._done = None
+        for counter in counters:
+            counter.count()
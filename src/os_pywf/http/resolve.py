@@ -0,0 +1,107 @@
+import ipaddress
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from os_pywf.http.upstream import WEIGHTED, Upstream
+
+DEFAULT_PREWARM_WORKERS = 32
+
+
+def _split_addresses(s):
+    return [a.strip() for a in s.split(",") if a.strip()]
+
+
+def resolve_from_string(s):
+    """Parse curl style ``host:port:addr[,addr...]``, IPv6 addr in brackets."""
+    parts = s.split(":", 2)
+    if len(parts) != 3 or not parts[0] or not parts[2]:
+        raise ValueError(f"invalid resolve {s}")
+    host, port, addresses = parts
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"invalid resolve {s}")
+    return (host.lower(), port, _split_addresses(addresses))
+
+
+def _address(addr, port=None):
+    if ":" in addr and not addr.startswith("["):
+        addr = f"[{addr}]"
+    return addr if port is None else f"{addr}:{port}"
+
+
+def _resolve_hosts(resolve):
+    hosts = {}
+    for key, addresses in resolve.items():
+        if isinstance(key, str):
+            host, _, port = key.rpartition(":")
+            key = (host, int(port))
+        host, port = key
+        host = host.lower()
+        if isinstance(addresses, str):
+            addresses = _split_addresses(addresses)
+        if host in hosts and hosts[host][0] != port:
+            raise ValueError(f"only one port of {host} can be resolved")
+        entry = hosts.setdefault(host, (port, []))
+        entry[1].extend([_address(a, port) for a in addresses])
+    return hosts
+
+
+def upstreams_from_resolve(resolve):
+    """Workflow upstreams named by host, one for each host of the map.
+
+    resolve maps ``host:port`` (or a (host, port) tuple) to an address or a
+    list of addresses. Requests of the host go to the addresses without DNS
+    lookup, the URL host is kept. A Workflow upstream is matched by host
+    only, so one port per host is supported.
+    """
+    return [
+        Upstream(host, servers, policy=WEIGHTED)
+        for host, (_, servers) in _resolve_hosts(resolve).items()
+    ]
+
+
+def ports_from_resolve(resolve):
+    """The resolved port of each host of the map."""
+    return dict([(host, port) for host, (port, _) in _resolve_hosts(resolve).items()])
+
+
+def _getaddrinfo(host):
+    try:
+        infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        return []
+    v4 = [i[4][0] for i in infos if i[0] == socket.AF_INET]
+    v6 = [i[4][0] for i in infos if i[0] == socket.AF_INET6]
+    # keep the order of the resolver, drop duplicates
+    return list(dict.fromkeys(v4 or v6))
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def prewarm(hosts, workers=DEFAULT_PREWARM_WORKERS):
+    """Resolve hosts concurrently, return upstreams of the resolved hosts
+    and the hosts failed to resolve.
+
+    The servers have no port, Workflow uses the port of the URL. IP
+    addresses are skipped. The addresses are not refreshed, they are used
+    until the upstreams are unregistered.
+    """
+    hosts = list(dict.fromkeys([h.lower() for h in hosts if not _is_ip(h)]))
+    if not hosts:
+        return [], []
+    with ThreadPoolExecutor(max_workers=min(workers, len(hosts))) as executor:
+        results = list(executor.map(_getaddrinfo, hosts))
+    upstreams = [
+        Upstream(host, [_address(a) for a in addresses], policy=WEIGHTED)
+        for host, addresses in zip(hosts, results)
+        if addresses
+    ]
+    failed = [host for host, addresses in zip(hosts, results) if not addresses]
+    return upstreams, failed
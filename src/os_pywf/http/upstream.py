@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pywf
+
+WEIGHTED = "weighted"
+CONSISTENT_HASH = "consistent-hash"
+ROUND_ROBIN = "round-robin"
+LEAST_LOADED = "least-loaded"
+
+POLICIES = (WEIGHTED, CONSISTENT_HASH, ROUND_ROBIN, LEAST_LOADED)
+
+DEFAULT_MAX_FAILS = 3
+# seconds a fused server is kept out of selection, same as Workflow upstream
+DEFAULT_MTTR = 30
+
+
+def server_from_string(s):
+    """Parse ``host:port[*weight]``, weight is at least 1."""
+    weight = 1
+    t = s.rfind("*")
+    if t > 0:
+        weight = int(s[t + 1 :])
+        s = s[:t]
+    return (s.strip(), weight)
+
+
+def upstream_from_string(s, policy=WEIGHTED, max_fails=DEFAULT_MAX_FAILS):
+    """Parse ``name=host:port[*weight][,host:port[*weight]...]``."""
+    t = s.find("=")
+    if t <= 0:
+        raise ValueError(f"invalid upstream {s}")
+    servers = [server_from_string(v) for v in s[t + 1 :].split(",") if v.strip()]
+    if not servers:
+        raise ValueError(f"invalid upstream {s}")
+    return Upstream(s[:t].strip(), servers, policy=policy, max_fails=max_fails)
+
+
+class Server(object):
+    __slots__ = ("address", "weight", "inflight", "fails", "fused_until")
+
+    def __init__(self, address, weight=1):
+        self.address = address
+        self.weight = weight
+        self.inflight = 0
+        self.fails = 0
+        self.fused_until = 0
+
+
+class Upstream(object):
+    """A named group of servers, URLs with the name as host are balanced.
+
+    weighted, consistent-hash and round-robin are Workflow upstreams, the
+    servers are fused by Workflow after max_fails failures and recovered
+    later. least-loaded is selected by the session with the number of
+    in-flight requests per weight, failed servers are fused the same way.
+    """
+
+    def __init__(
+        self,
+        name,
+        servers,
+        policy=WEIGHTED,
+        max_fails=DEFAULT_MAX_FAILS,
+        mttr=DEFAULT_MTTR,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"not supported upstream policy {policy}")
+        self.name = name
+        self.policy = policy
+        self.max_fails = max_fails
+        self.mttr = mttr
+        self.servers = [
+            Server(*((s,) if isinstance(s, str) else tuple(s))) for s in servers
+        ]
+        for server in self.servers:
+            if server.weight < 1:
+                raise ValueError(f"invalid weight of {server.address}")
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def register(self):
+        """Create the Workflow upstream, not needed for least-loaded."""
+        if self._registered or self.policy == LEAST_LOADED:
+            return
+        if self.policy == CONSISTENT_HASH:
+            pywf.upstream_create_consistent_hash(self.name)
+        elif self.policy == ROUND_ROBIN:
+            pywf.upstream_create_vnswrr(self.name)
+        else:
+            pywf.upstream_create_weighted_random(self.name, True)
+        for server in self.servers:
+            params = pywf.AddressParams()
+            params.weight = server.weight
+            params.max_fails = self.max_fails
+            pywf.upstream_add_server(self.name, server.address, params)
+        self._registered = True
+
+    def unregister(self):
+        """Delete the Workflow upstream, the name is resolved by DNS again."""
+        if not self._registered:
+            return
+        pywf.upstream_delete(self.name)
+        self._registered = False
+
+    def select(self):
+        """Least loaded server which is not fused, all are fused means none."""
+        now = time.monotonic()
+        with self._lock:
+            servers = [s for s in self.servers if s.fused_until <= now]
+            if not servers:
+                servers = self.servers
+            server = min(servers, key=lambda s: s.inflight / s.weight)
+            server.inflight += 1
+            return server
+
+    def done(self, server, ok):
+        with self._lock:
+            server.inflight -= 1
+            if ok:
+                server.fails = 0
+                server.fused_until = 0
+                return
+            server.fails += 1
+            if server.fails >= self.max_fails:
+                server.fused_until = time.monotonic() + self.mttr
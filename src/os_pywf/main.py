@@ -1,6 +1,15 @@
-from os_pywf.cmdline import execute
+import sys
 
 
 def main():
+    # same as os_pywf.profiling.PROFILE_STARTUP, which is not imported to
+    # keep the startup cheap
+    if "--profile-startup" in sys.argv[1:]:
+        from os_pywf.profiling import profile_startup
+
+        sys.exit(profile_startup(sys.argv[1:]))
+
+    from os_pywf.cmdline import execute
+
     command_packages = ["os_pywf.commands"]
     execute(command_packages=command_packages)
@@ -0,0 +1,242 @@
+import functools
+import os
+import sys
+import threading
+import time
+
+PROFILE_STARTUP = "--profile-startup"
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+def parse_import_time(lines):
+    """Parse lines of ``python -X importtime`` output.
+
+    Return list of (module, self_us, cumulative_us) in import order.
+    """
+    records = []
+    for line in lines:
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        fields = line[len(IMPORT_TIME_PREFIX) :].split("|")
+        if len(fields) != 3:
+            continue
+        self_us, cumulative_us, module = fields
+        try:
+            records.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:  # header line
+            continue
+    return records
+
+
+def format_import_time(records, top=20):
+    lines = []
+    total = sum([r[1] for r in records])
+    lines.append(f"startup imports: {len(records)} modules {total / 1000:.2f}ms")
+    lines.append(f"{'cumulative(ms)':>15} {'self(ms)':>10}  module")
+    for module, self_us, cumulative_us in sorted(
+        records, key=lambda r: r[2], reverse=True
+    )[:top]:
+        lines.append(f"{cumulative_us / 1000:>15.2f} {self_us / 1000:>10.2f}  {module}")
+    return "\n".join(lines)
+
+
+def profile_startup(argv, top=20):
+    """Run the command line in a child interpreter with ``-X importtime``.
+
+    The child stdout is passed through, import times are collected from the
+    child stderr and reported after it exits. Return the child exit code.
+    """
+    import subprocess
+
+    args = [a for a in argv if a != PROFILE_STARTUP]
+    code = "import sys; from os_pywf.main import main; sys.argv[0] = 'os-pywf'; main()"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([p for p in sys.path if p])
+    proc = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", code] + args,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=env,
+    )
+    lines = []
+    for line in proc.stderr:
+        if line.startswith(IMPORT_TIME_PREFIX):
+            lines.append(line)
+        else:
+            sys.stderr.write(line)
+    returncode = proc.wait()
+    sys.stderr.write(format_import_time(parse_import_time(lines), top) + "\n")
+    return returncode
+
+
+DEFAULT_TOP = 20
+DEFAULT_MALLOC_FRAMES = 1
+
+# the profiler in use, None means profiling disabled
+PROFILER = None
+
+
+def set_profiler(profiler):
+    global PROFILER
+    PROFILER = profiler
+
+
+def get_profiler():
+    return PROFILER
+
+
+class StageStats(object):
+    __slots__ = ("calls", "wall", "self_wall", "cpu", "max", "threads")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0
+        self.self_wall = 0
+        self.cpu = 0
+        self.max = 0
+        self.threads = set()
+
+
+class Profiler(object):
+    """Account time of the Python stages of a run.
+
+    Stages (prepare_request, build_response, cookies, callback) run on
+    several Workflow handler threads, each thread keeps its own stack of
+    stages so nested stages are not counted twice in self time. Wall and
+    CPU (thread_time) seconds are summed per stage over all threads. With
+    trace_malloc the top allocators are taken from a tracemalloc snapshot
+    when reported.
+    """
+
+    def __init__(
+        self, top=DEFAULT_TOP, trace_malloc=True, malloc_frames=DEFAULT_MALLOC_FRAMES
+    ):
+        self.top = top
+        self.trace_malloc = trace_malloc
+        self.malloc_frames = malloc_frames
+        self.stages = {}
+        self.started = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        import tracemalloc
+
+        self.started = time.perf_counter()
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start(self.malloc_frames)
+
+    def stop(self):
+        import tracemalloc
+
+        if self.trace_malloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def enter(self, name):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        # name, wall start, cpu start, wall of child stages
+        frame = [name, time.perf_counter(), time.thread_time(), 0]
+        stack.append(frame)
+        return frame
+
+    def exit(self, frame):
+        wall = time.perf_counter() - frame[1]
+        cpu = time.thread_time() - frame[2]
+        stack = self._local.stack
+        stack.pop()
+        if stack:
+            stack[-1][3] += wall
+        with self._lock:
+            stats = self.stages.get(frame[0], None)
+            if stats is None:
+                stats = self.stages[frame[0]] = StageStats()
+            stats.calls += 1
+            stats.wall += wall
+            stats.self_wall += wall - frame[3]
+            stats.cpu += cpu
+            stats.max = max(stats.max, wall)
+            stats.threads.add(threading.get_ident())
+
+    def top_allocations(self):
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            )
+        )
+        return snapshot.statistics("lineno")[: self.top]
+
+    def report(self):
+        lines = []
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        with self._lock:
+            stages = sorted(
+                self.stages.items(), key=lambda s: s[1].self_wall, reverse=True
+            )
+            threads = set()
+            for _, stats in stages:
+                threads |= stats.threads
+            lines.append(
+                f"profile pid {os.getpid()}: {elapsed:.3f}s, "
+                f"{len(threads)} threads ran stages"
+            )
+            lines.append(
+                f"{'stage':<16} {'calls':>8} {'total(ms)':>10} {'self(ms)':>10} "
+                f"{'cpu(ms)':>10} {'mean(us)':>9} {'max(ms)':>9} {'threads':>7}"
+            )
+            for name, s in stages:
+                lines.append(
+                    f"{name:<16} {s.calls:>8} {s.wall * 1000:>10.2f} "
+                    f"{s.self_wall * 1000:>10.2f} {s.cpu * 1000:>10.2f} "
+                    f"{s.wall / s.calls * 1000000:>9.1f} {s.max * 1000:>9.2f} "
+                    f"{len(s.threads):>7}"
+                )
+        allocations = self.top_allocations()
+        if allocations:
+            lines.append(f"top {len(allocations)} allocators:")
+            lines.append(f"{'size(KiB)':>10} {'count':>8}  line")
+            for stat in allocations:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"{stat.size / 1024:>10.1f} {stat.count:>8}  "
+                    f"{frame.filename}:{frame.lineno}"
+                )
+        return "\n".join(lines)
+
+
+def profiled(name):
+    """Account calls of the decorated function as stage name."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = PROFILER
+            if profiler is None:
+                return func(*args, **kwargs)
+            frame = profiler.enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.exit(frame)
+
+        return wrapper
+
+    return decorator
+
+
+def report_profile():
+    """Write the report of the profiler in use to stderr and stop it."""
+    profiler = PROFILER
+    if profiler is None:
+        return
+    set_profiler(None)
+    sys.stderr.write(profiler.report() + "\n")
+    profiler.stop()
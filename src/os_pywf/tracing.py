@@ -0,0 +1,148 @@
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+import os_pywf
+
+CHROME = "chrome"
+OTLP = "otlp"
+
+FORMATS = (CHROME, OTLP)
+
+DEFAULT_MAX_SPANS = 1000000
+
+# the tracer in use, None means tracing disabled
+TRACER = None
+
+
+def set_tracer(tracer):
+    global TRACER
+    TRACER = tracer
+
+
+def get_tracer():
+    return TRACER
+
+
+def now_ns():
+    return time.time_ns()
+
+
+class Tracer(object):
+    """Record spans of requests, callbacks and timers.
+
+    A trace is a chain of requests, the request and its retries and
+    redirects, the sampling decision is made when the chain starts. Spans
+    are kept in memory, at most max_spans, and exported at the end as Chrome
+    trace events (chrome://tracing, Perfetto) or OTLP JSON.
+    """
+
+    def __init__(self, sample_rate=1.0, max_spans=DEFAULT_MAX_SPANS):
+        self.sample_rate = sample_rate
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def new_trace(self):
+        """Return a new trace id or None when not sampled."""
+        if not self.sampled():
+            return None
+        return next(self._ids)
+
+    def span(self, name, trace, start, end=None, **args):
+        if end is None:
+            end = now_ns()
+        self._add((name, trace, start, end, threading.get_ident(), args))
+
+    def instant(self, name, trace, **args):
+        t = now_ns()
+        self._add((name, trace, t, None, threading.get_ident(), args))
+
+    def _add(self, span):
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped += 1
+                return
+            self.spans.append(span)
+
+    def chrome_events(self):
+        pid = os.getpid()
+        events = []
+        for name, trace, start, end, tid, args in self.spans:
+            event = {
+                "name": name,
+                "cat": "os_pywf",
+                "pid": pid,
+                # one row per trace, spans without trace on the thread row
+                "tid": f"trace-{trace}" if trace is not None else tid,
+                "ts": start / 1000,
+                "args": dict(args, thread=tid),
+            }
+            if end is None:
+                event["ph"] = "i"
+                event["s"] = "t"
+            else:
+                event["ph"] = "X"
+                event["dur"] = (end - start) / 1000
+            events.append(event)
+        return events
+
+    def otlp_spans(self):
+        pid = os.getpid()
+        spans = []
+        for i, (name, trace, start, end, tid, args) in enumerate(self.spans):
+            trace_id = trace if trace is not None else 0
+            attributes = [
+                {"key": k, "value": {"stringValue": str(v)}} for k, v in args.items()
+            ]
+            attributes.append({"key": "thread.id", "value": {"intValue": str(tid)}})
+            spans.append(
+                {
+                    "traceId": f"{pid:016x}{trace_id:016x}",
+                    "spanId": f"{i + 1:016x}",
+                    "name": name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(start),
+                    "endTimeUnixNano": str(end if end is not None else start),
+                    "attributes": attributes,
+                }
+            )
+        return spans
+
+    def export(self, filename, format=CHROME):
+        if format == OTLP:
+            o = {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {
+                                    "key": "service.name",
+                                    "value": {"stringValue": "os-pywf"},
+                                }
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {
+                                    "name": "os_pywf",
+                                    "version": os_pywf.__version__,
+                                },
+                                "spans": self.otlp_spans(),
+                            }
+                        ],
+                    }
+                ]
+            }
+        else:
+            o = {"traceEvents": self.chrome_events(), "displayTimeUnit": "ms"}
+        with open(filename, "w") as f:
+            json.dump(o, f)
@@ -1,24 +1,103 @@
 import copy
-import email
 import inspect
 import logging
+import mmap
 import os
 import time
 import types
 import urllib
+from collections import OrderedDict
 from enum import Enum
-from http import cookiejar as cookielib
-from http.cookies import SimpleCookie
 from importlib import import_module
 from pkgutil import iter_modules
-from threading import Event
-from typing import Callable, Optional
+from threading import Event, Lock
+from typing import TYPE_CHECKING, Callable, Optional
 
-import pywf
-from requests.cookies import MockRequest, MockResponse, cookiejar_from_dict
+if TYPE_CHECKING:
+    import pywf
+
+# pywf, requests, email and http.cookiejar are imported where they are used,
+# importing this module should stay cheap for short-lived command line runs.
 
 MILLION = 1000000
 
+CHUNK_SIZE = 1024 * 1024
+
+
+class FileBody(object):
+    """Request body backed by a file.
+
+    The file is memory mapped and yielded in chunks each time the body is
+    iterated, so it is never loaded into memory as a whole.
+    """
+
+    def __init__(self, filename, chunk_size=CHUNK_SIZE):
+        self.filename = filename
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return os.path.getsize(self.filename)
+
+    def __iter__(self):
+        with open(self.filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for i in range(0, len(m), self.chunk_size):
+                    yield m[i : i + self.chunk_size]
+
+    def read(self):
+        with open(self.filename, "rb") as f:
+            return f.read()
+
+    def __bytes__(self):
+        return self.read()
+
+
+class MultipartBody(object):
+    """multipart/form-data body framed around the field contents.
+
+    Fields are (name, (filename, content, content_type)) same as the files
+    parameter of requests, content is str, bytes or FileBody. File contents
+    are streamed instead of concatenated.
+    """
+
+    def __init__(self, fields, boundary=None):
+        from urllib3.fields import RequestField
+        from urllib3.filepost import choose_boundary
+
+        self.boundary = boundary or choose_boundary()
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.segments = []
+        for name, value in fields:
+            filename, content, content_type = (tuple(value) + (None,))[:3]
+            if content is None:
+                continue
+            if isinstance(content, str):
+                content = content.encode("utf8")
+            rf = RequestField(name=name, data=b"", filename=filename)
+            rf.make_multipart(content_type=content_type)
+            head = f"--{self.boundary}\r\n{rf.render_headers()}".encode("utf8")
+            self.segments.extend([head, content, b"\r\n"])
+        self.segments.append(f"--{self.boundary}--\r\n".encode("utf8"))
+
+    def __len__(self):
+        return sum([len(s) for s in self.segments])
+
+    def __iter__(self):
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                yield segment
+            else:
+                for chunk in segment:
+                    yield chunk
+
+    def read(self):
+        return b"".join(self)
+
+    def __bytes__(self):
+        return self.read()
+
 
 def formparam_from_string(s):
     t = s.find("=")
@@ -38,8 +117,7 @@ def formparam_from_string(s):
         s = ""
     params = [None] * 3
     if os.path.exists(fn) and os.path.isfile(fn):
-        with open(fn, "rb") as f:
-            params[1] = f.read()
+        params[1] = FileBody(fn)
     if s:
         for kv in s.split(";"):
             p = kv.split("=", 1)
@@ -55,13 +133,15 @@ def formparam_from_string(s):
     return (name, tuple(params))
 
 
-def bytes_from_data(data, urlencode=False):
+def bytes_from_data(data, urlencode=False, lazy=False):
     if isinstance(data, bytes):
         pass
     elif isinstance(data, str):
         if data.startswith("@"):
             fn = data[1:]
             if os.path.exists(fn) and os.path.isfile(fn):
+                if lazy and not urlencode:
+                    return FileBody(fn)
                 with open(fn, "rb") as f:
                     data = f.read()
         else:
@@ -72,6 +152,11 @@ def bytes_from_data(data, urlencode=False):
 
 
 def cookiejar_from_string(cookie_string):
+    from http import cookiejar as cookielib
+    from http.cookies import SimpleCookie
+
+    from requests.cookies import cookiejar_from_dict
+
     cookies = SimpleCookie()
     cookies.load(cookie_string)
     cj = cookielib.CookieJar()
@@ -79,12 +164,16 @@ def cookiejar_from_string(cookie_string):
 
 
 def cookiejar_from_file(filename):
+    from http import cookiejar as cookielib
+
     cj = cookielib.MozillaCookieJar(filename)
     cj.load(ignore_discard=True)
     return cj
 
 
 def save_cookiejar(filename: str, cookiejar):
+    from http import cookiejar as cookielib
+
     cj = cookielib.MozillaCookieJar()
     for cookie in cookiejar:
         cj.set_cookie(copy.copy(cookie))
@@ -92,9 +181,16 @@ def save_cookiejar(filename: str, cookiejar):
 
 
 def extract_cookies_to_jar(jar, request, response):
-    msg = email.message_from_string(
-        "\r\n".join([f"{k}: {v}" for k, v in response.headers.items()])
-    )
+    from requests.cookies import MockRequest, MockResponse
+
+    if hasattr(response.headers, "get_all"):  # every Set-Cookie is kept
+        msg = response.headers
+    else:
+        import email
+
+        msg = email.message_from_string(
+            "\r\n".join([f"{k}: {v}" for k, v in response.headers.items()])
+        )
     req = MockRequest(request)
     res = MockResponse(msg)
     jar.extract_cookies(res, req)
@@ -105,6 +201,8 @@ def now_ms():
 
 
 def create_series_work(*tasks, callback=None):
+    import pywf
+
     if not tasks:
         return pywf.create_series_work(pywf.create_empty_task(), callback)
     series = pywf.create_series_work(tasks[0], callback)
@@ -112,12 +210,32 @@ def create_series_work(*tasks, callback=None):
     return series
 
 
+def _traced_timer_callback(tracer, microseconds, callback):
+    from os_pywf.tracing import now_ns
+
+    start = now_ns()
+
+    def _callback(task):
+        tracer.span("timer wait", None, start, microseconds=microseconds)
+        callback(task)
+
+    return _callback
+
+
 def create_timer_task(
     microseconds: int,
-    callback: Optional[Callable[[pywf.cpp_pyworkflow.TimerTask], None]],
+    callback: Optional[Callable[["pywf.cpp_pyworkflow.TimerTask"], None]],
     step: Optional[int] = None,
     cancel: Optional[Event] = None,  # [TODO] not proper type
-) -> pywf.cpp_pyworkflow.TimerTask:
+) -> "pywf.cpp_pyworkflow.TimerTask":
+    import pywf
+
+    from os_pywf import tracing
+
+    tracer = tracing.TRACER
+    if tracer is not None and callback is not None and tracer.sampled():
+        callback = _traced_timer_callback(tracer, microseconds, callback)
+
     if cancel is None:
         return pywf.create_timer_task(microseconds, callback)
     if isinstance(step, int):
@@ -165,6 +283,63 @@ def create_timer_task(
     return pywf.create_timer_task(step, _callback)
 
 
+class Stats(object):
+    """Thread safe counters."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values = {}
+
+    def inc(self, key, count=1):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + count
+
+    def get(self, key, default=0):
+        return self._values.get(key, default)
+
+    def merge(self, values):
+        with self._lock:
+            for k, v in values.items():
+                self._values[k] = self._values.get(k, 0) + v
+
+    def to_dict(self):
+        with self._lock:
+            return dict(self._values)
+
+    def __str__(self):
+        return str(self.to_dict())
+
+
+class LRUCache(object):
+    """Thread safe bounded mapping, least recently used items are dropped."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def __len__(self):
+        return len(self._data)
+
+
 def kv_from_string(s):
     c = s.find(":")
     if c < 0:
@@ -173,6 +348,8 @@ def kv_from_string(s):
 
 
 def wf_error_string(state, code):
+    import pywf
+
     return pywf.get_error_string(state, code)
 
 
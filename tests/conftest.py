@@ -0,0 +1,279 @@
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pytest
+
+BASELINES = os.path.join(os.path.dirname(__file__), "benchmarks.json")
+
+# a benchmark fails when its time is over baseline * (1 + threshold), times
+# are the fastest round in units of the calibration time
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_ROUNDS = 5
+CALIBRATION_ROUNDS = 5
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="Run tests marked benchmark.",
+    )
+    group.addoption(
+        "--benchmark-save",
+        action="store_true",
+        default=False,
+        help="Store times of the benchmarks as baselines.",
+    )
+    group.addoption(
+        "--benchmark-threshold",
+        type=float,
+        default=float(os.environ.get("OS_PYWF_BENCHMARK_THRESHOLD", DEFAULT_THRESHOLD)),
+        help="Max slowdown ratio over baseline, env OS_PYWF_BENCHMARK_THRESHOLD.",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: performance regression test")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark") or config.getoption("--benchmark-save"):
+        return
+    skip = pytest.mark.skip(reason="benchmark, run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+class BenchHandler(BaseHTTPRequestHandler):
+    """Response is shaped by query parameters.
+
+    delay (ms) before responding, size of the body, redirects to follow
+    before the final response, error ratio of 500 responses (every
+    1/error-th request of the server, so runs are repeatable), cookies
+    number of Set-Cookie headers, status of the final response.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def _count(self):
+        with self.server.lock:
+            self.server.requests += 1
+            return self.server.requests
+
+    def _param(self, query, name, default, cast=int):
+        return cast(query.get(name, [default])[0])
+
+    def _respond(self, send_body):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        delay = self._param(query, "delay", 0, float)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        error = self._param(query, "error", 0, float)
+        redirects = self._param(query, "redirects", 0)
+        status = self._param(query, "status", 200)
+        body = b""
+        headers = []
+        if error > 0 and self._count() % max(1, round(1 / error)) == 0:
+            status = 500
+        elif redirects > 0:
+            query["redirects"] = [str(redirects - 1)]
+            status = 302
+            headers.append(("Location", f"{url.path}?{urlencode(query, True)}"))
+        else:
+            body = b"x" * self._param(query, "size", 0)
+            for i in range(self._param(query, "cookies", 0)):
+                headers.append(("Set-Cookie", f"c{i}=v{i}; Path=/"))
+        self.send_response(status)
+        for k, v in headers:
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self._respond(True)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer(object):
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), BenchHandler)
+        self.server.daemon_threads = True
+        # number of accepted connections
+        self.server.connections = 0
+        self.server.requests = 0
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    def url(self, path="/", **params):
+        url = f"{self.base_url}{path}"
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        return url
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope="session")
+def http_server():
+    """Local threaded HTTP server, see BenchHandler for the parameters."""
+    server = LocalServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+def _calibration_workload():
+    keys = [f"k{i}" for i in range(1000)]
+    d = dict.fromkeys(keys, 0)
+    for _ in range(200):
+        for k in keys:
+            d[k] += 1
+    return d
+
+
+def calibrate(rounds=CALIBRATION_ROUNDS):
+    """Seconds of a fixed pure Python workload on this machine, the fastest
+    round is the least disturbed one."""
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        _calibration_workload()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class Benchmark(object):
+    """The fastest round divided by the calibration time measured around the
+    benchmark, so times are comparable across machines and loads."""
+
+    def __init__(self, name, baselines, threshold, save):
+        self.name = name
+        self.baselines = baselines
+        self.threshold = threshold
+        self.save = save
+        self.times = []
+
+    def __call__(self, func, *args, rounds=DEFAULT_ROUNDS, **kwargs):
+        """Run func rounds times, compare the fastest round with the baseline."""
+        baseline = self.baselines.get(self.name, None)
+        if baseline is None and not self.save:
+            # recorded on a machine with all the dependencies of the benchmark
+            pytest.skip(f"{self.name} has no baseline, store one with --benchmark-save")
+        result = None
+        self.times = times = []
+        calibration = calibrate()
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            times.append(time.perf_counter() - start)
+        calibration = min(calibration, calibrate())
+        ratio = min(times) / calibration
+        print(
+            f"\nbenchmark {self.name} median {statistics.median(times) * 1000:.3f}ms "
+            f"min {min(times) * 1000:.3f}ms calibration {calibration * 1000:.3f}ms "
+            f"ratio {ratio:.3f} baseline " + (f"{baseline:.3f}" if baseline else "none")
+        )
+        if self.save:
+            self.baselines[self.name] = round(ratio, 4)
+        elif ratio > baseline * (1 + self.threshold):
+            pytest.fail(
+                f"{self.name} ratio {ratio:.3f} to calibration is over baseline "
+                f"{baseline:.3f} by more than {self.threshold:.0%}"
+            )
+        return result
+
+
+@pytest.fixture(scope="session")
+def benchmark_baselines(request):
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+    yield baselines
+    if request.config.getoption("--benchmark-save"):
+        with open(BASELINES, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+@pytest.fixture
+def benchmark(request, benchmark_baselines):
+    """Time a function, fail when slower than its stored baseline.
+
+    Baselines in tests/benchmarks.json keyed by test name are times in
+    units of the calibration time, --benchmark-save updates them. A
+    benchmark without a baseline is skipped.
+    """
+    config = request.config
+    return Benchmark(
+        request.node.name,
+        benchmark_baselines,
+        config.getoption("--benchmark-threshold"),
+        config.getoption("--benchmark-save"),
+    )
+
+
+class Counters(object):
+    """Stub of pywf counter tasks, names of the counted ones are kept in order."""
+
+    def __init__(self):
+        self.counted = []
+
+    def __call__(self, name):
+        return _Counter(name, self.counted)
+
+
+class _Counter(object):
+    def __init__(self, name, counted):
+        self.name = name
+        self.counted = counted
+
+    def count(self):
+        self.counted.append(self.name)
+
+
+@pytest.fixture
+def counters():
+    return Counters()
@@ -0,0 +1,42 @@
+from os_pywf.http import adaptive
+from os_pywf.http.adaptive import AdaptiveLimiter
+
+
+def test_adaptive_aimd(monkeypatch, counters):
+    now = [100.0]
+    monkeypatch.setattr(adaptive, "preferred_clock", lambda: now[0])
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=4)
+    assert limiter.acquire("a", None) is None
+    assert limiter.acquire("a", None) is None
+    c = limiter.acquire("a", lambda: counters("w"))
+    assert c is not None and limiter.waiting() == 1
+
+    # 2 + 1/2 + 1/2.5 grows to 2.9, then over 3
+    now[0] += 0.1
+    assert limiter.release("a", 100.0) == 2
+    assert counters.counted == ["w"]
+    assert limiter.release("a", 100.0) == 2
+    assert limiter.release("a", 100.0) == 3
+    for _ in range(10):
+        assert limiter.acquire("a", None) is None
+        limiter.release("a", now[0] - 0.1)
+    assert limiter.limits() == {"a": 4}
+
+    # one cut for the requests started before it
+    started = now[0]
+    for _ in range(3):
+        assert limiter.acquire("a", None) is None
+    now[0] += 0.1
+    assert limiter.release("a", started, status_code=429) == 2
+    assert limiter.release("a", started, error=True) == 2
+    now[0] += 1
+    assert limiter.release("a", now[0] - 0.1, status_code=503) == 1
+
+    # slow response is congestion too
+    assert limiter.acquire("b", None) is None
+    assert limiter.acquire("b", None) is None
+    assert limiter.release("b", now[0] - 0.1) == 2
+    now[0] += 1
+    assert limiter.release("b", now[0] - 1) == 1
+    assert limiter.limits() == {"a": 1, "b": 1}
+    assert [h.inflight for h in limiter._hosts.values()] == [0, 0]
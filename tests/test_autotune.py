@@ -0,0 +1,22 @@
+from os_pywf.autotune import autotune
+
+
+def test_autotune_machine():
+    settings = autotune(cpu_count=8, nofile=1024)
+    assert settings == {
+        "compute_threads": 8,
+        "handler_threads": 8,
+        "poller_threads": 4,
+    }
+
+
+def test_autotune_job():
+    settings = autotune(hosts=100, concurrency=10000, cpu_count=2, nofile=1024)
+    assert settings["handler_threads"] == 2
+    assert settings["poller_threads"] == 1
+    assert settings["dns_threads"] == 13
+    assert settings["max_connections"] == (1024 - 64) // 100
+
+    settings = autotune(hosts=1, concurrency=1, cpu_count=2, nofile=None)
+    assert settings["max_connections"] == 1
+    assert settings["dns_threads"] == 4
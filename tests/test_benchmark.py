@@ -0,0 +1,160 @@
+import threading
+from urllib.request import urlopen
+
+import pytest
+from requests import Request, Response
+from requests.cookies import RequestsCookieJar, get_cookie_header, merge_cookies
+
+from os_pywf.http.cookies import SqliteCookieJar
+from os_pywf.http.headers import ResponseHeaders
+from os_pywf.utils import extract_cookies_to_jar
+
+N_REQUESTS = 200
+N_RESPONSES = 1000
+N_TIMERS = 10000
+N_COOKIES = 20
+N_COOKIE_RESPONSES = 200
+
+
+def test_local_server(http_server):
+    with urlopen(http_server.url("/", size=10, redirects=2, cookies=2)) as r:
+        assert r.status == 200
+        assert r.read() == b"x" * 10
+        assert len(r.headers.get_all("Set-Cookie")) == 2
+    with pytest.raises(Exception):
+        urlopen(http_server.url("/", error=1))
+
+
+def _cookie_responses(n):
+    responses = []
+    for i in range(n):
+        request = Request("GET", f"http://h{i % 10}.example.com/p").prepare()
+        response = Response()
+        response.url = request.url
+        response.request = request
+        response.headers = ResponseHeaders(
+            [("Set-Cookie", f"c{j}=v{j}; Path=/") for j in range(N_COOKIES)]
+        )
+        response.raw = None
+        responses.append(response)
+    return responses
+
+
+def _extract_and_merge(jar, responses):
+    for response in responses:
+        extract_cookies_to_jar(jar, response.request, response)
+        merged = merge_cookies(RequestsCookieJar(), jar)
+        get_cookie_header(merged, response.request)
+
+
+@pytest.mark.benchmark
+def test_bench_cookies(benchmark):
+    responses = _cookie_responses(N_COOKIE_RESPONSES)
+    benchmark(lambda: _extract_and_merge(RequestsCookieJar(), responses))
+
+
+@pytest.mark.benchmark
+def test_bench_sqlite_cookies(benchmark, tmpdir):
+    responses = _cookie_responses(N_COOKIE_RESPONSES)
+
+    def _run():
+        jar = SqliteCookieJar(str(tmpdir.join("cookies.db")))
+        _extract_and_merge(jar, responses)
+        jar.clear()
+        jar.close()
+
+    benchmark(_run)
+
+
+class FakeResp(object):
+    headers = [("Content-Type", "text/html; charset=utf-8")] + [
+        (f"X-Header-{i}", "v" * 20) for i in range(20)
+    ]
+    body = b"x" * 16384
+
+    def get_status_code(self):
+        return "200"
+
+    def get_reason_phrase(self):
+        return "OK"
+
+    def get_headers(self):
+        return self.headers
+
+    def get_body(self):
+        return self.body
+
+
+class FakeTask(object):
+    resp = FakeResp()
+
+    def get_state(self):
+        return 0
+
+    def get_resp(self):
+        return self.resp
+
+
+@pytest.mark.benchmark
+def test_bench_build_response(benchmark):
+    pytest.importorskip("pywf")
+    from os_pywf.http.client import build_response
+
+    request = Request("GET", "http://example.com/").prepare()
+    task = FakeTask()
+
+    def _run():
+        for _ in range(N_RESPONSES):
+            response = build_response(task, request)
+            response.content
+            response.headers["content-type"]
+
+    benchmark(_run)
+
+
+def _run_all(pywf, tasks):
+    done = threading.Event()
+    parallel = pywf.create_parallel_work(lambda p: done.set())
+    for task in tasks:
+        parallel.add_series(pywf.create_series_work(task, None))
+    parallel.start()
+    done.wait()
+
+
+@pytest.mark.benchmark
+def test_bench_timers(benchmark):
+    pywf = pytest.importorskip("pywf")
+
+    def _noop(t):
+        pass
+
+    benchmark(
+        lambda: _run_all(
+            pywf, [pywf.create_timer_task(0, _noop) for _ in range(N_TIMERS)]
+        )
+    )
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"size": 1024},
+        {"size": 1024 * 1024},
+        {"size": 1024, "redirects": 2},
+        {"size": 1024, "error": 0.1},
+        {"size": 1024, "delay": 10},
+    ],
+    ids=["small", "large", "redirects", "errors", "latency"],
+)
+def test_bench_session(benchmark, http_server, params):
+    pywf = pytest.importorskip("pywf")
+    from os_pywf.http.client import Session
+
+    url = http_server.url("/", **params)
+    with Session(max_retries=1) as session:
+        benchmark(
+            lambda: _run_all(pywf, [session.get(url) for _ in range(N_REQUESTS)]),
+            rounds=3,
+        )
+    assert session.stats.get("responses") > 0
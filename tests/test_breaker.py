@@ -0,0 +1,53 @@
+from os_pywf.http.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_circuit_opens_on_failure_ratio():
+    breaker = CircuitBreaker(failure_ratio=0.5, min_requests=4, window=4)
+    key = "example.com"
+    assert breaker.allow(key)
+    assert not breaker.record(key, False)
+    assert not breaker.record(key, True)
+    assert not breaker.record(key, True)
+    assert breaker.state(key) == CLOSED
+    assert breaker.record(key, False)
+    assert breaker.state(key) == OPEN
+    assert not breaker.allow(key)
+    assert breaker.state("other.com") == CLOSED
+
+
+def test_circuit_half_open_probe():
+    breaker = CircuitBreaker(min_requests=1, window=1, reset_timeout=0, probes=1)
+    key = "example.com"
+    assert breaker.record(key, False)
+    assert breaker.allow(key)
+    assert breaker.state(key) == HALF_OPEN
+    assert breaker.record(key, False)
+    assert breaker.state(key) == OPEN
+    assert breaker.allow(key)
+    assert not breaker.record(key, True)
+    assert breaker.state(key) == CLOSED
+
+
+def test_circuit_half_open_limits_probes():
+    breaker = CircuitBreaker(min_requests=1, window=1, reset_timeout=60, probes=2)
+    key = "example.com"
+    breaker.record(key, False)
+    circuit = breaker._circuits[key]
+    circuit.opened_at -= 60
+    assert breaker.allow(key)
+    assert breaker.allow(key)
+    assert not breaker.allow(key)
+
+
+def test_circuit_created_on_failure():
+    breaker = CircuitBreaker(failure_ratio=0.5, min_requests=4, window=2)
+    assert breaker.allow("example.com")
+    assert not breaker.record("example.com", True)
+    assert breaker._circuits == {}
+    breaker.record("example.com", False)
+    assert list(breaker._circuits) == ["example.com"]
+    breaker.record("example.com", True)
+    # the failure is out of the window, the closed circuit is dropped
+    breaker.record("example.com", True)
+    assert breaker._circuits == {}
+    assert breaker.state("example.com") == CLOSED
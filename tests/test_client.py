@@ -0,0 +1,177 @@
+import pickle
+import threading
+import types
+from datetime import timedelta
+
+import pytest
+from requests import Request, Response
+
+pywf = pytest.importorskip("pywf")
+
+from os_pywf.exceptions import Failure, ResolvedPortError, WFException  # noqa: E402
+from os_pywf.http.client import (  # noqa: E402
+    RedirectRecord,
+    Session,
+    pack_request,
+    pack_response,
+    unpack_request,
+    unpack_response,
+)
+
+
+def test_pack_request_response():
+    request = Request("POST", "http://example.com/", data={"k": "v"}).prepare()
+    response = Response()
+    response.url = request.url
+    response.status_code = 200
+    response.reason = "OK"
+    response.headers["Content-Type"] = "text/plain"
+    response.elapsed = timedelta(seconds=1)
+    response._content = b"hello"
+
+    packed = pickle.loads(
+        pickle.dumps((pack_request(request), pack_response(response)))
+    )
+    r = unpack_request(packed[0])
+    assert (r.method, r.url, r.body) == ("POST", request.url, "k=v")
+    o = unpack_response(packed[1], r)
+    assert o.status_code == 200
+    assert o.headers["content-type"] == "text/plain"
+    assert o.text == "hello"
+    assert o.request is r
+
+    failure = Failure(WFException(1, 2), None)
+    o = unpack_response(pickle.loads(pickle.dumps(pack_response(failure))), r)
+    assert isinstance(o, Failure)
+    assert (o.exception.state, o.exception.code) == (1, 2)
+
+
+def test_permanent_redirect_cache():
+    session = Session()
+    request = session.prepare_request(
+        Request("GET", "http://example.com/x", cookies={"k": "v"})
+    )
+    session.redirect_cache.set("http://example.com/x", "https://example.com/x")
+    session.redirect_cache.set("https://example.com/x", "https://example.com/x/")
+    rewritten = session._rewrite_permanent_redirect(request)
+    assert rewritten.url == "https://example.com/x/"
+    assert rewritten.headers["Cookie"] == "k=v"
+    assert request.url == "http://example.com/x"
+
+    session.redirect_cache.set("https://example.com/x/", "http://example.com/x")
+    assert session._rewrite_permanent_redirect(request) is request
+
+
+def test_permanent_redirect_cache_auth():
+    session = Session()
+    request = session.prepare_request(
+        Request(
+            "GET",
+            "http://example.com/a",
+            auth=("user", "pass"),
+            headers={"Proxy-Authorization": "Basic cHJveHk6cHJveHk="},
+        )
+    )
+    assert "Authorization" in request.headers
+    # upgrade to https of the same host keeps credentials
+    session.redirect_cache.set("http://example.com/a", "https://example.com/a")
+    rewritten = session._rewrite_permanent_redirect(request)
+    assert rewritten.headers["Authorization"] == request.headers["Authorization"]
+
+    session.redirect_cache.set("https://example.com/a", "https://other.example/a")
+    rewritten = session._rewrite_permanent_redirect(request)
+    assert rewritten.url == "https://other.example/a"
+    assert "Authorization" not in rewritten.headers
+    assert "Proxy-Authorization" not in rewritten.headers
+    assert "Authorization" in request.headers
+
+
+class FakeSeries(object):
+    def __init__(self):
+        self.tasks = []
+
+    def push_front(self, task):
+        self.tasks.insert(0, task)
+
+    def push_back(self, task):
+        self.tasks.append(task)
+
+
+def test_schedule_list():
+    session = Session()
+    session.get = lambda url, **kwargs: url
+    series = FakeSeries()
+    session._schedule(series, (["a", "b"], ["c", "d"]))
+    assert series.tasks == ["a", "b", "c", "d"]
+    session._schedule(series, "e")
+    assert series.tasks == ["e", "a", "b", "c", "d"]
+
+
+def test_pack_lean_history():
+    request = Request("GET", "http://example.com/").prepare()
+    response = Response()
+    response.url = request.url
+    response.status_code = 200
+    response._content = b""
+    response.history = [
+        RedirectRecord(301, "Moved", "http://example.com/a", {"Location": "/"})
+    ]
+    unpacked = unpack_response(pack_response(response), request)
+    record = unpacked.history[0]
+    assert isinstance(record, RedirectRecord)
+    assert (record.status_code, record.url) == (301, "http://example.com/a")
+    assert record.headers["location"] == "/"
+
+
+def test_resolve_removed_on_close(monkeypatch):
+    from os_pywf.http import upstream
+
+    calls = []
+    for name in ("upstream_create_weighted_random", "upstream_delete"):
+        monkeypatch.setattr(
+            upstream.pywf,
+            name,
+            lambda *args, name=name: calls.append((name, args[0])),
+            raising=False,
+        )
+    monkeypatch.setattr(
+        upstream.pywf, "upstream_add_server", lambda *args: None, raising=False
+    )
+    monkeypatch.setattr(
+        upstream.pywf, "AddressParams", types.SimpleNamespace, raising=False
+    )
+    session = Session(resolve={"resolve.example:443": "127.0.0.1"})
+    assert "resolve.example" in session.upstreams
+    request = session.prepare_request(Request("GET", "http://resolve.example/"))
+    # only port 443 is resolved, send fails the request instead of raising
+    with pytest.raises(ResolvedPortError):
+        session.create_http_task(request, None)
+    monkeypatch.setattr(session, "_reject", lambda request, handle, e: e)
+    assert isinstance(session.send(request), ResolvedPortError)
+    session.close()
+    assert not session.upstreams and not session.resolved_hosts
+    assert calls == [
+        ("upstream_create_weighted_random", "resolve.example"),
+        ("upstream_delete", "resolve.example"),
+    ]
+
+
+def test_warmup(http_server):
+    session = Session()
+    failing = "http://127.0.0.1:1/"
+    connections = http_server.connections
+    times = {}
+    done = threading.Event()
+    task = session.warmup(
+        [http_server.url("/a"), http_server.url("/b"), failing], 2, times.update
+    )
+    pywf.create_series_work(task, lambda s: done.set()).start()
+    assert done.wait(10)
+
+    base = http_server.url("/")
+    assert sorted(times) == sorted([base, failing])
+    assert len(times[base]) == 2 and all([e > 0 for e in times[base]])
+    assert times[failing] == [None, None]
+    assert http_server.connections - connections == 2
+    assert session.stats.get("warmup_connections") == 2
+    assert session.stats.get("warmup_failures") == 2
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from requests.cookies import create_cookie
+
+from os_pywf.http import cookies
+from os_pywf.http.cookies import SqliteCookieJar, domain_candidates
+
+
+def test_domain_candidates():
+    assert domain_candidates("www.Example.com") == [
+        "www.example.com",
+        ".www.example.com",
+        "example.com",
+        ".example.com",
+        "com",
+        ".com",
+    ]
+    assert "localhost.local" in domain_candidates("localhost")
+
+
+def test_sqlite_cookie_jar(tmpdir):
+    filename = str(tmpdir.join("cookies.db"))
+    jar = SqliteCookieJar(filename, batch_size=3, flush_interval=60)
+    jar.set_cookie(create_cookie("a", "1", domain=".example.com"))
+    jar.set_cookie(create_cookie("b", "2", domain="www.example.com"))
+    jar.set_cookie(create_cookie("c", "3", domain="other.com"))
+    jar.set_cookie(
+        create_cookie("d", "4", domain=".example.com", expires=int(time.time()) + 3600)
+    )
+
+    # a, b and c are flushed as a batch, d is pending
+    other = SqliteCookieJar(filename)
+    assert len(other) == 0
+    other.load_url("http://www.example.com/")
+    assert sorted(c.name for c in other) == ["a", "b"]
+    other.close()
+
+    jar.clear(".example.com", "/", "a")
+    jar.close()
+
+    jar = SqliteCookieJar(filename)
+    jar.load_url("http://example.com/")
+    assert [c.name for c in jar] == ["d"]
+    jar.load_url("https://other.com/x")
+    assert sorted(c.name for c in jar) == ["c", "d"]
+    # loaded once, nothing written back
+    assert not jar._pending
+    jar.clear()
+    jar.close()
+
+    jar = SqliteCookieJar(filename)
+    jar.load_url("http://www.example.com/")
+    assert len(jar) == 0
+    jar.close()
+
+
+def test_sqlite_cookie_jar_concurrent_load(tmpdir, monkeypatch):
+    filename = str(tmpdir.join("cookies.db"))
+    jar = SqliteCookieJar(filename)
+    jar.set_cookie(create_cookie("a", "1", domain="example.com"))
+    jar.close()
+
+    jar = SqliteCookieJar(filename)
+    loading, resume = threading.Event(), threading.Event()
+    from_json = cookies.cookie_from_json
+
+    def _slow_from_json(data):
+        loading.set()
+        resume.wait(5)
+        return from_json(data)
+
+    monkeypatch.setattr(cookies, "cookie_from_json", _slow_from_json)
+    first = threading.Thread(target=jar.load_domains, args=(["example.com"],))
+    first.start()
+    assert loading.wait(5)
+    seen = []
+
+    def _second():
+        jar.load_domains(["example.com"])
+        seen.extend([c.name for c in jar])
+
+    second = threading.Thread(target=_second)
+    second.start()
+    resume.set()
+    first.join(5)
+    second.join(5)
+    # the second load returns only when the cookies are in the jar
+    assert seen == ["a"]
+    jar.close()
+
+
+def test_sqlite_cookie_jar_load_all(tmpdir):
+    filename = str(tmpdir.join("cookies.db"))
+    jar = SqliteCookieJar(filename)
+    jar.set_cookie(create_cookie("a", "1", domain="example.com"))
+    jar.set_cookie(create_cookie("b", "2", domain="other.com"))
+    jar.close()
+
+    jar = SqliteCookieJar(filename, flush_interval=60)
+    jar.load_url("http://example.com/")
+    jar.set_cookie(create_cookie("c", "3", domain="third.com"))
+    jar.load_all()
+    assert sorted(c.name for c in jar) == ["a", "b", "c"]
+    jar.close()
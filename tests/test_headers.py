@@ -0,0 +1,51 @@
+import pickle
+
+from requests import Request
+from requests.cookies import RequestsCookieJar
+
+from os_pywf.http.headers import ResponseHeaders
+from os_pywf.utils import extract_cookies_to_jar
+
+
+class Response(object):
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_response_headers():
+    headers = ResponseHeaders(
+        [
+            ("Content-Type", "text/html"),
+            ("Set-Cookie", "a=1; Expires=Wed, 09 Jun 2100 10:18:14 GMT; Path=/"),
+            ("Set-Cookie", "b=2; Path=/"),
+        ]
+    )
+    assert headers._materialized is None
+    assert headers["content-type"] == "text/html"
+    assert "SET-COOKIE" in headers
+    assert "Location" not in headers
+    assert headers.get("location") is None
+    assert len(headers.get_all("set-cookie")) == 2
+    assert headers._materialized is None
+
+    assert dict(headers.lower_items())["set-cookie"].endswith(", b=2; Path=/")
+    assert headers._materialized is not None
+
+    headers["Set-Cookie"] = "c=3"
+    assert headers.get_all("set-cookie") == ["c=3"]
+    del headers["content-type"]
+    assert headers.multi_items() == [("Set-Cookie", "c=3")]
+    assert pickle.loads(pickle.dumps(headers)) == headers
+
+
+def test_extract_multiple_cookies():
+    request = Request("GET", "http://example.com/").prepare()
+    headers = ResponseHeaders(
+        [
+            ("Set-Cookie", "a=1; Expires=Wed, 09 Jun 2100 10:18:14 GMT; Path=/"),
+            ("Set-Cookie", "b=2; Path=/"),
+        ]
+    )
+    jar = RequestsCookieJar()
+    extract_cookies_to_jar(jar, request, Response(headers))
+    assert jar.get_dict() == {"a": "1", "b": "2"}
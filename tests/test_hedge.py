@@ -0,0 +1,32 @@
+import pytest
+
+from os_pywf.http.hedge import MIN_SAMPLES, Hedger, delay_from_string
+
+
+def test_delay_from_string():
+    assert delay_from_string("0.05") == (0.05, None)
+    assert delay_from_string(0.1) == (0.1, None)
+    assert delay_from_string("p95") == (None, 95.0)
+    for s in ("p0", "p100", "-1", "fast"):
+        with pytest.raises(ValueError):
+            delay_from_string(s)
+
+
+def test_hedger_percentile_delay():
+    hedger = Hedger("p90")
+    for i in range(MIN_SAMPLES - 1):
+        hedger.observe(i / 100)
+    assert hedger.delay() is None
+    hedger.observe(0.19)
+    assert hedger.delay() == pytest.approx(0.17)
+    assert Hedger("0.2").delay() == 0.2
+
+
+def test_hedger_budget():
+    hedger = Hedger("0.01", ratio=0.2)
+    allowed = 0
+    for _ in range(100):
+        hedger.add()
+        if hedger.allow():
+            allowed += 1
+    assert allowed == 20
@@ -0,0 +1,101 @@
+import gzip
+import json
+from datetime import timedelta
+
+import pytest
+from requests import Request, Response
+
+from os_pywf.http.output import BodySink, HarSink, JsonlSink, OutputWriter, WarcSink
+from os_pywf.utils import FileBody
+
+
+class Resp(object):
+    def get_http_version(self):
+        return "HTTP/1.1"
+
+    def get_body(self):
+        return b"hello"
+
+
+class Task(object):
+    def get_resp(self):
+        return Resp()
+
+
+def response_of(request):
+    response = Response()
+    response.url = request.url
+    response.status_code = 200
+    response.reason = "OK"
+    response.headers["Content-Type"] = "text/plain"
+    response.elapsed = timedelta(seconds=0.1)
+    response._content = b"hello"
+    return response
+
+
+def test_output_writer(tmp_path):
+    sinks = [
+        BodySink(str(tmp_path / "bodies")),
+        JsonlSink(str(tmp_path / "meta.jsonl")),
+        WarcSink(str(tmp_path / "out.warc.gz")),
+    ]
+    writer = OutputWriter(sinks, queue_size=2, batch_size=2)
+    writer.start()
+    for i in range(5):
+        request = Request("GET", f"http://example.com/{i}?q=1").prepare()
+        writer.record(Task(), request, response_of(request))
+    writer.close()
+
+    lines = open(tmp_path / "meta.jsonl").read().splitlines()
+    assert len(lines) == 5
+    meta = json.loads(lines[0])
+    assert meta["status"] == 200
+    assert open(tmp_path / "bodies" / meta["file"], "rb").read() == b"hello"
+
+    warc = gzip.open(tmp_path / "out.warc.gz").read()
+    assert warc.count(b"WARC-Type: response") == 5
+    assert warc.count(b"WARC-Type: request") == 5
+    assert b"GET /0?q=1 HTTP/1.1" in warc
+
+
+def test_warc_file_body(tmp_path):
+    upload = tmp_path / "upload.bin"
+    upload.write_bytes(b"0123456789" * 10)
+    request = Request("PUT", "http://example.com/up").prepare()
+    request.body = FileBody(str(upload), chunk_size=7)
+    request.headers["Content-Length"] = "100"
+    writer = OutputWriter([WarcSink(str(tmp_path / "out.warc"))])
+    writer.start()
+    writer.record(Task(), request, response_of(request))
+    writer.close()
+
+    warc = (tmp_path / "out.warc").read_bytes()
+    assert warc.count(b"WARC-Type: request") == 1
+    assert b"PUT /up HTTP/1.1" in warc
+    assert b"\r\n\r\n" + b"0123456789" * 10 in warc
+
+
+def test_har_sink_roundtrip(tmp_path, monkeypatch):
+    pytest.importorskip("pywf")
+    from os_pywf.http import replay
+
+    request = Request("POST", "http://example.com/a", data=b"k=v").prepare()
+    writer = OutputWriter([HarSink(str(tmp_path / "out.har"))])
+    writer.start()
+    writer.record(Task(), request, response_of(request))
+    writer.record(Task(), request, response_of(request))
+    writer.close()
+
+    har = json.loads((tmp_path / "out.har").read_text())
+    entries = har["log"]["entries"]
+    assert len(entries) == 2
+    assert entries[0]["response"]["status"] == 200
+    assert entries[0]["response"]["content"]["text"] == "hello"
+
+    monkeypatch.setattr(replay, "READ_SIZE", 7)
+    with open(tmp_path / "out.har", encoding="utf8") as f:
+        specs = list(replay.iter_specs(f, "out.har"))
+    assert [(s.method, s.url, s.body) for s in specs] == [
+        ("POST", "http://example.com/a", b"k=v")
+    ] * 2
+    assert specs[0].time is not None
@@ -0,0 +1,28 @@
+from os_pywf.http.priority import PriorityDispatcher
+
+
+def test_priority_order(counters):
+    dispatcher = PriorityDispatcher(1, aging=0)
+    assert dispatcher.acquire(0, None) is None
+    for name, priority in (("low", 0), ("high", 10), ("mid", 5), ("high2", 10)):
+        c = dispatcher.acquire(priority, lambda: counters(name))
+        assert c is not None
+    assert dispatcher.waiting() == 4
+    for _ in range(4):
+        dispatcher.release()
+    assert counters.counted == ["high", "high2", "mid", "low"]
+    assert dispatcher.inflight == 1
+    dispatcher.release()
+    assert dispatcher.inflight == 0
+
+
+def test_priority_aging(monkeypatch, counters):
+    now = [100.0]
+    monkeypatch.setattr("os_pywf.http.priority.time.monotonic", lambda: now[0])
+    dispatcher = PriorityDispatcher(1, aging=1)
+    dispatcher.acquire(0, None)
+    dispatcher.acquire(0, lambda: counters("old"))
+    now[0] += 20
+    dispatcher.acquire(10, lambda: counters("new"))
+    dispatcher.release()
+    assert counters.counted == ["old"]
@@ -0,0 +1,51 @@
+from os_pywf.profiling import (
+    Profiler,
+    format_import_time,
+    parse_import_time,
+    profiled,
+    set_profiler,
+)
+
+
+def test_parse_import_time():
+    lines = [
+        "import time: self [us] | cumulative | imported package\n",
+        "import time:       220 |        220 |   urllib\n",
+        "import time:     10097 |      45645 | os_pywf.utils\n",
+        "not a import time line\n",
+    ]
+    records = parse_import_time(lines)
+    assert records == [("urllib", 220, 220), ("os_pywf.utils", 10097, 45645)]
+    report = format_import_time(records, top=1)
+    assert "2 modules" in report
+    assert "os_pywf.utils" in report
+    assert "urllib" not in report.split("\n", 2)[2]
+
+
+def test_profiler_stages():
+    profiler = Profiler(trace_malloc=False)
+    profiler.start()
+
+    @profiled("inner")
+    def inner():
+        return 1
+
+    @profiled("outer")
+    def outer():
+        return inner() + inner()
+
+    assert outer() == 2
+    set_profiler(profiler)
+    try:
+        assert outer() == 2
+    finally:
+        set_profiler(None)
+
+    assert sorted(profiler.stages.keys()) == ["inner", "outer"]
+    assert profiler.stages["inner"].calls == 2
+    assert profiler.stages["outer"].calls == 1
+    outer_stats = profiler.stages["outer"]
+    assert outer_stats.self_wall <= outer_stats.wall
+    report = profiler.report()
+    assert "outer" in report and "inner" in report
+    assert "allocators" not in report
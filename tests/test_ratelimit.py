@@ -0,0 +1,110 @@
+import threading
+import types
+
+import pytest
+
+pytest.importorskip("pywf")
+
+from os_pywf.http import ratelimit  # noqa: E402
+from os_pywf.http.ratelimit import RateLimiter, TokenBucket  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(
+        ratelimit, "time", types.SimpleNamespace(monotonic=lambda: now[0])
+    )
+    return now
+
+
+def _limiter(monkeypatch, **kwargs):
+    limiter = RateLimiter(**kwargs)
+    ticks = []
+    monkeypatch.setattr(limiter, "_start_tick", ticks.append)
+    return limiter, ticks
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(8, burst=3)
+    for _ in range(3):
+        assert bucket.delay(100.0) == 0
+        bucket.consume()
+    assert bucket.delay(100.0) == 0.125
+    assert bucket.delay(100.0625) == 0.0625
+    assert bucket.delay(100.125) == 0
+    # refill is capped by burst
+    assert bucket.delay(200.0) == 0
+    assert bucket.tokens == 3
+
+
+def test_global_and_host(monkeypatch, clock):
+    limiter, _ = _limiter(monkeypatch, rate=8, rate_per_host=1, burst=2)
+    assert limiter.acquire("a")
+    assert limiter.acquire("a")
+    # host bucket of a is empty, global bucket too
+    assert not limiter.acquire("a")
+    assert not limiter.acquire("b")
+    clock[0] += 0.125
+    assert limiter.acquire("b")
+    assert not limiter.acquire("a")
+    clock[0] += 1
+    assert limiter.acquire("a")
+
+
+def test_tick(monkeypatch, clock, counters):
+    limiter, ticks = _limiter(monkeypatch, rate_per_host=1)
+    counted = counters.counted
+    assert limiter.acquire("a")
+    assert limiter.acquire("b")
+    limiter.wait("a", counters("a1"))
+    limiter.wait("a", counters("a2"))
+    limiter.wait("b", counters("b1"))
+    assert ticks == [0] and limiter.waiting() == 3
+    # nothing is due before the host buckets refill
+    limiter._tick(None)
+    assert counted == [] and ticks[-1] == pytest.approx(ratelimit.MAX_TICK)
+    clock[0] += 1
+    limiter._tick(None)
+    assert counted == ["a1", "b1"] and ticks[-1] == pytest.approx(ratelimit.MAX_TICK)
+    # a waiting host blocks new requests of it only
+    assert not limiter.acquire("a")
+    clock[0] += 1
+    limiter._tick(None)
+    assert counted == ["a1", "b1", "a2"]
+    assert limiter.waiting() == 0 and not limiter._ticking
+
+
+def test_tick_shares_global(monkeypatch, clock, counters):
+    limiter, ticks = _limiter(monkeypatch, rate=1, rate_per_host=10)
+    counted = counters.counted
+    assert limiter.acquire("a")
+    for name in ("a1", "a2", "b1"):
+        limiter.wait(name[0], counters(name))
+    clock[0] += 0.75
+    limiter._tick(None)
+    assert counted == [] and ticks[-1] == 0.25
+    clock[0] += 0.25
+    limiter._tick(None)
+    assert counted == ["a1"] and ticks[-1] == pytest.approx(ratelimit.MAX_TICK)
+    # b waited since the first tick, it goes before the second of a
+    clock[0] += 1
+    limiter._tick(None)
+    assert counted == ["a1", "b1"]
+    clock[0] += 1
+    limiter._tick(None)
+    assert counted == ["a1", "b1", "a2"] and not limiter._ticking
+
+
+def test_cancel_releases(monkeypatch, clock, counters):
+    cancel = threading.Event()
+    limiter, ticks = _limiter(monkeypatch, rate=1, rate_per_host=1, cancel=cancel)
+    counted = counters.counted
+    assert limiter.acquire("a")
+    limiter.wait("a", counters("a1"))
+    limiter.wait("b", counters("b1"))
+    limiter.wait("a", counters("a2"))
+    cancel.set()
+    limiter._tick(None)
+    assert sorted(counted) == ["a1", "a2", "b1"]
+    assert limiter.waiting() == 0 and not limiter._ticking
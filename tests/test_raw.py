@@ -0,0 +1,62 @@
+import pytest
+from requests import Request
+
+from os_pywf.exceptions import Failure
+from os_pywf.http.raw import RawResponse, load_raw_response, release_raw_response
+
+
+class FakeResp(object):
+    def __init__(self):
+        self.calls = []
+
+    def get_status_code(self):
+        self.calls.append("status")
+        return "302"
+
+    def get_reason_phrase(self):
+        return "Found"
+
+    def get_headers(self):
+        self.calls.append("headers")
+        return [
+            ("Location", "/a"),
+            ("Content-Type", "application/json; charset=utf-8"),
+        ]
+
+    def get_body(self):
+        self.calls.append("body")
+        return b'{"k": "v"}'
+
+
+def test_raw_response_lazy():
+    resp = FakeResp()
+    request = Request("GET", "http://example.com/").prepare()
+    response = RawResponse(resp, request)
+    assert resp.calls == []
+    assert response.status_code == 302
+    assert response.status_code == 302
+    assert resp.calls == ["status"]
+    assert response.is_redirect
+    assert response.headers["location"] == "/a"
+    release_raw_response(response)
+    with pytest.raises(RuntimeError):
+        response.content
+
+
+def test_raw_response_load():
+    request = Request("GET", "http://example.com/").prepare()
+    response = RawResponse(FakeResp(), request)
+    load_raw_response(Failure(Exception(), response))
+    assert response.json() == {"k": "v"}
+    assert response.encoding == "utf-8"
+    assert response.reason == "Found"
+    assert response.url == "http://example.com/"
+
+
+def test_raw_response_unknown_charset():
+    resp = FakeResp()
+    resp.get_headers = lambda: [("Content-Type", "text/plain; charset=x-unknown")]
+    resp.get_body = lambda: "café".encode("utf8") + b"\xff"
+    request = Request("GET", "http://example.com/").prepare()
+    response = RawResponse(resp, request)
+    assert response.text == "café�"
@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip("pywf")
+
+from os_pywf.http import replay  # noqa: E402
+from os_pywf.http.replay import iter_specs, parse_time  # noqa: E402
+
+
+def test_iter_jsonl():
+    lines = [
+        {"url": "http://example.com/", "headers": {"X-A": "1"}, "time": 1.5},
+        {"method": "put", "url": "http://example.com/b", "body_base64": "AAE="},
+    ]
+    f = io.StringIO("\n".join([json.dumps(o) for o in lines]) + "\n\n")
+    specs = list(iter_specs(f, "spec.jsonl"))
+    assert specs[0].method == "GET"
+    assert specs[0].headers == [("X-A", "1")]
+    assert specs[0].time == 1.5
+    assert specs[1].method == "PUT"
+    assert specs[1].body == b"\x00\x01"
+
+
+def test_iter_har_skips_pseudo_headers():
+    har = {
+        "log": {
+            "version": "1.2",
+            "pages": [{"title": "entries"}],
+            "entries": [
+                {
+                    "startedDateTime": "2021-01-01T00:00:01.500Z",
+                    "request": {
+                        "method": "GET",
+                        "url": "http://example.com/",
+                        "headers": [
+                            {"name": ":authority", "value": "example.com"},
+                            {"name": "Content-Length", "value": "0"},
+                            {"name": "Accept", "value": "*/*"},
+                        ],
+                    },
+                }
+            ],
+        }
+    }
+    specs = list(iter_specs(io.StringIO(json.dumps(har)), "a.har"))
+    assert len(specs) == 1
+    assert specs[0].headers == [("Accept", "*/*")]
+    assert specs[0].time == parse_time("2021-01-01T00:00:00Z") + 1.5
+
+
+def test_iter_specs_detects_stdin(monkeypatch):
+    monkeypatch.setattr(replay, "READ_SIZE", 16)
+    lines = [{"url": f"http://example.com/{i}"} for i in range(3)]
+    f = io.StringIO("".join([json.dumps(o) + "\n" for o in lines]))
+    specs = list(iter_specs(f, "-"))
+    assert [s.url for s in specs] == [o["url"] for o in lines]
+
+    har = {"log": {"entries": [{"request": dict(lines[0], method="GET")}]}}
+    for text in (json.dumps(har), json.dumps(har, indent=2)):
+        specs = list(iter_specs(io.StringIO(text), "-"))
+        assert [s.url for s in specs] == ["http://example.com/0"]
+
+
+def test_iter_specs_skips_malformed():
+    errors = []
+    lines = ['{"url": "http://example.com/0"}', "{", '{"method": "GET"}', "[]"]
+    lines.append('{"url": "http://example.com/1", "body_base64": "A"}')
+    lines.append('{"url": "http://example.com/2"}')
+    f = io.StringIO("\n".join(lines))
+    specs = list(iter_specs(f, "a.jsonl", lambda where, e: errors.append(where)))
+    assert [s.url for s in specs] == ["http://example.com/0", "http://example.com/2"]
+    assert errors == ["line 2", "line 3", "line 4", "line 5"]
+
+    errors = []
+    entries = [{"request": {"url": "http://example.com/"}}, {"request": None}]
+    entries.append({"request": {"method": "GET", "url": "http://example.com/"}})
+    har = json.dumps({"log": {"entries": entries}})
+    specs = list(iter_specs(io.StringIO(har), "a.har", lambda w, e: errors.append(w)))
+    assert len(specs) == 1 and errors == ["entry 1", "entry 2"]
+
+    with pytest.raises(KeyError):
+        list(iter_specs(io.StringIO(har), "a.har"))
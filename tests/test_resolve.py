@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("pywf")
+
+from os_pywf.http import resolve  # noqa: E402
+from os_pywf.http.resolve import (  # noqa: E402
+    ports_from_resolve,
+    prewarm,
+    resolve_from_string,
+    upstreams_from_resolve,
+)
+
+
+def test_resolve_from_string():
+    assert resolve_from_string("Example.com:443:10.0.0.1,10.0.0.2") == (
+        "example.com",
+        443,
+        ["10.0.0.1", "10.0.0.2"],
+    )
+    assert resolve_from_string("a.com:80:[::1]") == ("a.com", 80, ["[::1]"])
+    for s in ("a.com:80", "a.com:x:10.0.0.1", ":80:10.0.0.1"):
+        with pytest.raises(ValueError):
+            resolve_from_string(s)
+
+
+def test_upstreams_from_resolve():
+    upstreams = upstreams_from_resolve(
+        {"a.com:443": "10.0.0.1", ("b.com", 80): ["::1", "10.0.0.2"]}
+    )
+    servers = dict([(u.name, [s.address for s in u.servers]) for u in upstreams])
+    assert servers == {"a.com": ["10.0.0.1:443"], "b.com": ["[::1]:80", "10.0.0.2:80"]}
+    with pytest.raises(ValueError):
+        upstreams_from_resolve({"a.com:443": "10.0.0.1", "a.com:80": "10.0.0.1"})
+
+
+def test_prewarm(monkeypatch):
+    addresses = {"a.com": ["10.0.0.1", "10.0.0.1", "10.0.0.2"], "b.com": []}
+    monkeypatch.setattr(resolve, "_getaddrinfo", lambda host: addresses[host])
+    upstreams, failed = prewarm(["A.com", "a.com", "b.com", "10.0.0.3"])
+    assert [(u.name, [s.address for s in u.servers]) for u in upstreams] == [
+        ("a.com", ["10.0.0.1", "10.0.0.1", "10.0.0.2"])
+    ]
+    assert failed == ["b.com"]
+
+
+def test_ports_from_resolve():
+    assert ports_from_resolve({"A.com:443": "10.0.0.1", ("b.com", 80): []}) == {
+        "a.com": 443,
+        "b.com": 80,
+    }
@@ -0,0 +1,38 @@
+import json
+
+from os_pywf.tracing import OTLP, Tracer
+
+
+def test_tracer_export(tmp_path):
+    tracer = Tracer()
+    trace = tracer.new_trace()
+    tracer.span("network", trace, 1000, 5000, url="http://example.com/")
+    tracer.instant("redirect", trace, status=301)
+    tracer.span("timer wait", None, 2000, 3000)
+
+    filename = tmp_path / "trace.json"
+    tracer.export(str(filename))
+    events = json.loads(filename.read_text())["traceEvents"]
+    assert [e["ph"] for e in events] == ["X", "i", "X"]
+    assert events[0]["tid"] == f"trace-{trace}"
+    assert events[0]["dur"] == 4
+    assert events[0]["args"]["url"] == "http://example.com/"
+
+    filename = tmp_path / "trace.otlp.json"
+    tracer.export(str(filename), OTLP)
+    o = json.loads(filename.read_text())
+    spans = o["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["network", "redirect", "timer wait"]
+    assert spans[0]["traceId"] == spans[1]["traceId"]
+    assert len(spans[0]["traceId"]) == 32
+    assert spans[0]["endTimeUnixNano"] == "5000"
+
+
+def test_tracer_sampling_and_limit():
+    tracer = Tracer(sample_rate=0)
+    assert tracer.new_trace() is None
+    tracer = Tracer(max_spans=1)
+    tracer.span("a", None, 0, 1)
+    tracer.span("b", None, 0, 1)
+    assert len(tracer.spans) == 1
+    assert tracer.dropped == 1
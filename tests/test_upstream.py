@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("pywf")
+
+from os_pywf.http.upstream import (  # noqa: E402
+    LEAST_LOADED,
+    Upstream,
+    server_from_string,
+    upstream_from_string,
+)
+
+
+def test_upstream_from_string():
+    assert server_from_string("127.0.0.1:8080*3") == ("127.0.0.1:8080", 3)
+    assert server_from_string("127.0.0.1:8080") == ("127.0.0.1:8080", 1)
+    upstream = upstream_from_string("backend=a:80,b:80*2", policy=LEAST_LOADED)
+    assert upstream.name == "backend"
+    assert [(s.address, s.weight) for s in upstream.servers] == [
+        ("a:80", 1),
+        ("b:80", 2),
+    ]
+    for s in ("backend", "=a:80", "backend="):
+        with pytest.raises(ValueError):
+            upstream_from_string(s)
+    with pytest.raises(ValueError):
+        Upstream("backend", ["a:80"], policy="unknown")
+    for s in ("backend=a:80*0", "backend=a:80,b:80*-1"):
+        with pytest.raises(ValueError):
+            upstream_from_string(s, policy=LEAST_LOADED)
+
+
+def test_least_loaded_select():
+    upstream = Upstream("backend", ["a:80", ("b:80", 2)], policy=LEAST_LOADED)
+    selected = [upstream.select().address for _ in range(3)]
+    assert selected == ["a:80", "b:80", "b:80"]
+    a = upstream.servers[0]
+    upstream.done(a, True)
+    assert upstream.select() is a
+    upstream.done(a, True)
+
+
+def test_least_loaded_ejection():
+    upstream = Upstream("backend", ["a:80", "b:80"], policy=LEAST_LOADED, max_fails=2)
+    a, b = upstream.servers
+    for _ in range(2):
+        assert upstream.select() is a
+        upstream.done(a, False)
+    # a is ejected, only b is selected even when it is loaded
+    assert [upstream.select() for _ in range(3)] == [b, b, b]
+    a.fused_until = 0
+    assert upstream.select() is a
+    upstream.done(a, True)
+    assert a.fails == 0
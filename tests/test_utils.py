@@ -0,0 +1,57 @@
+from urllib3.fields import RequestField
+from urllib3.filepost import encode_multipart_formdata
+
+from os_pywf.utils import (
+    FileBody,
+    LRUCache,
+    MultipartBody,
+    bytes_from_data,
+    formparam_from_string,
+)
+
+
+def test_file_body(tmp_path):
+    fn = tmp_path / "data"
+    fn.write_bytes(b"0123456789")
+    body = bytes_from_data(f"@{fn}", lazy=True)
+    assert isinstance(body, FileBody)
+    assert len(body) == 10
+    body.chunk_size = 4
+    assert list(body) == [b"0123", b"4567", b"89"]
+    assert bytes_from_data(f"@{fn}") == b"0123456789"
+
+    fn.write_bytes(b"")
+    assert list(body) == []
+
+
+def test_multipart_body(tmp_path):
+    fn = tmp_path / "data"
+    fn.write_bytes(b"0123456789")
+    forms = [
+        formparam_from_string(s)
+        for s in ("a=1", f"f=@{fn};type=text/plain;filename=x.txt")
+    ]
+    body = MultipartBody(forms, boundary="boundary")
+    assert body.content_type == "multipart/form-data; boundary=boundary"
+
+    fields = []
+    for name, (filename, content, content_type) in [
+        ("a", (None, "1", None)),
+        ("f", ("x.txt", b"0123456789", "text/plain")),
+    ]:
+        rf = RequestField(name=name, data=content, filename=filename)
+        rf.make_multipart(content_type=content_type)
+        fields.append(rf)
+    expected, _ = encode_multipart_formdata(fields, boundary="boundary")
+    assert len(body) == len(expected)
+    assert b"".join(body) == expected
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c"), len(cache)) == (1, 3, 2)